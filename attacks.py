@@ -0,0 +1,97 @@
+"""
+Attack map kept up to date as moves are made and unmade on a Board, so "is this square attacked?" is a single
+bit test instead of a sweep over every piece.
+"""
+from board import *
+
+
+class AttackMap:
+    """
+    Per-square attacker counts for each color. Attach one to a board by assigning it to board.attack_map.
+    """
+
+    def __init__(self, board):
+        """
+        Builds the map from scratch for the board's current position.
+        attacks holds the squares attacked by the piece on each square, owners that piece's color, counts how
+        many pieces of each color attack each square and attacked the squares where that count is above zero.
+        :param board: Board
+        """
+        self.board = board
+        self.attacks = [0] * 64
+        self.owners = [None] * 64
+        self.counts = {WHITE: [0] * 64, BLACK: [0] * 64}
+        self.attacked = {WHITE: 0, BLACK: 0}
+        for sq in board.occupied():
+            self.refresh(sq)
+
+    def is_attacked(self, sq, by_color):
+        """
+        Determines if any piece of by_color attacks the square.
+        :param sq: int
+        :param by_color: 'White' / 'Black'
+        :return: True / False
+        """
+        return self.attacked[by_color] >> sq & 1 == 1
+
+    def refresh(self, sq):
+        """
+        Recomputes the attacks of whatever is on sq and applies the difference to the counts.
+        :param sq: int
+        :return:
+        """
+        piece = self.board.squares[sq]
+        old = self.attacks[sq]
+        new = self.board.attacks_from(sq) if piece is not None else 0
+        owner = self.owners[sq]
+        color = piece[0] if piece is not None else None
+        if owner != color:
+            self._count(owner, old, -1)
+            self._count(color, new, 1)
+        elif old != new:
+            self._count(color, old & ~new, -1)
+            self._count(color, new & ~old, 1)
+        self.attacks[sq] = new
+        self.owners[sq] = color
+
+    def _count(self, color, squares, step):
+        """
+        Adds step to color's attacker count on each square, keeping the attacked bitboard in line.
+        :param color: 'White' / 'Black', or None for an empty square
+        :param squares: bitboard
+        :param step: 1 or -1
+        :return:
+        """
+        if color is None:
+            return
+        counts = self.counts[color]
+        attacked = self.attacked[color]
+        while squares:
+            low = squares & -squares
+            sq = low.bit_length() - 1
+            counts[sq] += step
+            if counts[sq] == 0:
+                attacked &= ~low
+            else:
+                attacked |= low
+            squares ^= low
+        self.attacked[color] = attacked
+
+    def update(self, changed):
+        """
+        Brings the map up to date after the pieces on the changed squares were added, removed or moved. Only
+        those squares and the sliders whose rays reached one of them need recomputing, since a slider's
+        attacks can only change when a square it could see changes.
+        :param changed: bitboard of squares whose contents changed
+        :return:
+        """
+        attacks = self.attacks
+        for sq in squares_of(changed):
+            self.refresh(sq)
+        bitboards = self.board.bitboards
+        sliders = 0
+        for color in (WHITE, BLACK):
+            sliders |= bitboards[(color, BISHOP)] | bitboards[(color, ROOK)] | bitboards[(color, QUEEN)]
+        for sq in squares_of(sliders & ~changed):
+            if attacks[sq] & changed:
+                self.refresh(sq)
@@ -0,0 +1,204 @@
+"""
+Bitboard helpers and precomputed attack tables for the rules core. A bitboard is a Python int where bit n is
+set when square n (y * 8 + x, see board.py) is in the set.
+
+Leaper attacks (knight, king, pawn) are plain 64-entry tables. Sliding attacks are looked up per square by the
+occupancy of that square's relevant rays, the result for each occupancy being worked out from the ray tables
+the first time it is seen and then stored.
+"""
+
+FULL = (1 << 64) - 1
+
+# (dx, dy) and the square index step each direction makes
+NORTH, SOUTH, EAST, WEST = (0, -1), (0, 1), (1, 0), (-1, 0)
+NORTH_EAST, NORTH_WEST, SOUTH_EAST, SOUTH_WEST = (1, -1), (-1, -1), (1, 1), (-1, 1)
+ROOK_RAYS = (NORTH, SOUTH, EAST, WEST)
+BISHOP_RAYS = (NORTH_EAST, NORTH_WEST, SOUTH_EAST, SOUTH_WEST)
+
+
+def lsb(bb):
+    """
+    Index of the lowest set square.
+    :param bb: non-empty bitboard
+    :return: int
+    """
+    return (bb & -bb).bit_length() - 1
+
+
+def msb(bb):
+    """
+    Index of the highest set square.
+    :param bb: non-empty bitboard
+    :return: int
+    """
+    return bb.bit_length() - 1
+
+
+def squares_of(bb):
+    """
+    Lists the squares set in a bitboard, lowest first.
+    :param bb: int
+    :return: list of int
+    """
+    squares = []
+    while bb:
+        low = bb & -bb
+        squares.append(low.bit_length() - 1)
+        bb ^= low
+    return squares
+
+
+def count(bb):
+    """
+    Number of squares set in a bitboard.
+    :param bb: int
+    :return: int
+    """
+    return bin(bb).count('1')
+
+
+def _leaper_table(steps):
+    """
+    Builds an attack table for a piece that jumps by fixed (dx, dy) steps.
+    :param steps: tuple of (dx, dy)
+    :return: list of 64 bitboards
+    """
+    table = []
+    for sq in range(64):
+        x, y = sq % 8, sq // 8
+        attacks = 0
+        for dx, dy in steps:
+            if 0 <= x + dx < 8 and 0 <= y + dy < 8:
+                attacks |= 1 << ((y + dy) * 8 + x + dx)
+        table.append(attacks)
+    return table
+
+
+def _ray(sq, direction):
+    """
+    Every square from sq (exclusive) to the edge of the board in one direction.
+    :param sq: int
+    :param direction: (dx, dy)
+    :return: bitboard
+    """
+    dx, dy = direction
+    x, y = sq % 8 + dx, sq // 8 + dy
+    ray = 0
+    while 0 <= x < 8 and 0 <= y < 8:
+        ray |= 1 << (y * 8 + x)
+        x += dx
+        y += dy
+    return ray
+
+
+KNIGHT_ATTACKS = _leaper_table(((2, 1), (2, -1), (-2, 1), (-2, -1), (1, 2), (-1, 2), (1, -2), (-1, -2)))
+KING_ATTACKS = _leaper_table(((1, 1), (1, -1), (1, 0), (-1, 1), (-1, -1), (-1, 0), (0, 1), (0, -1)))
+WHITE_PAWN_ATTACKS = _leaper_table(((1, -1), (-1, -1)))
+BLACK_PAWN_ATTACKS = _leaper_table(((1, 1), (-1, 1)))
+
+RAYS = {direction: [_ray(sq, direction) for sq in range(64)] for direction in ROOK_RAYS + BISHOP_RAYS}
+
+# directions that run towards higher square indexes stop at their lowest blocker, the others at their highest
+_INCREASING = (SOUTH, EAST, SOUTH_EAST, SOUTH_WEST)
+
+
+def _edge_trimmed(sq, direction):
+    """
+    A ray without its last square. A piece on the board edge can't block anything beyond it, so it doesn't
+    need to be part of the occupancy key.
+    :param sq: int
+    :param direction: (dx, dy)
+    :return: bitboard
+    """
+    ray = RAYS[direction][sq]
+    if ray:
+        end = lsb(ray) if direction not in _INCREASING else msb(ray)
+        ray &= ~(1 << end)
+    return ray
+
+
+def _slide(sq, occupied, directions):
+    """
+    Sliding attacks from sq worked out ray by ray: each ray is cut off past its first blocker.
+    :param sq: int
+    :param occupied: bitboard of every piece
+    :param directions: rays the piece slides along
+    :return: bitboard
+    """
+    attacks = 0
+    for direction in directions:
+        ray = RAYS[direction][sq]
+        blockers = ray & occupied
+        if blockers:
+            blocker = lsb(blockers) if direction in _INCREASING else msb(blockers)
+            ray ^= RAYS[direction][blocker]
+        attacks |= ray
+    return attacks
+
+
+def _between_table():
+    """
+    BETWEEN[a][b] holds the squares strictly between a and b when they share a rank, file or diagonal, and is
+    empty otherwise.
+    :return: 64 x 64 list of bitboards
+    """
+    table = [[0] * 64 for _ in range(64)]
+    for sq in range(64):
+        for dx, dy in ROOK_RAYS + BISHOP_RAYS:
+            x, y = sq % 8 + dx, sq // 8 + dy
+            passed = 0
+            while 0 <= x < 8 and 0 <= y < 8:
+                target = y * 8 + x
+                table[sq][target] = passed
+                passed |= 1 << target
+                x += dx
+                y += dy
+    return table
+
+
+BETWEEN = _between_table()
+
+ROOK_MASKS = [sum(_edge_trimmed(sq, d) for d in ROOK_RAYS) for sq in range(64)]
+BISHOP_MASKS = [sum(_edge_trimmed(sq, d) for d in BISHOP_RAYS) for sq in range(64)]
+_ROOK_TABLES = [{} for _ in range(64)]
+_BISHOP_TABLES = [{} for _ in range(64)]
+
+
+def rook_attacks(sq, occupied):
+    """
+    Squares a rook on sq attacks, up to and including the first piece on each ray.
+    :param sq: int
+    :param occupied: bitboard of every piece
+    :return: bitboard
+    """
+    key = occupied & ROOK_MASKS[sq]
+    table = _ROOK_TABLES[sq]
+    attacks = table.get(key)
+    if attacks is None:
+        attacks = table[key] = _slide(sq, key, ROOK_RAYS)
+    return attacks
+
+
+def bishop_attacks(sq, occupied):
+    """
+    Squares a bishop on sq attacks, up to and including the first piece on each ray.
+    :param sq: int
+    :param occupied: bitboard of every piece
+    :return: bitboard
+    """
+    key = occupied & BISHOP_MASKS[sq]
+    table = _BISHOP_TABLES[sq]
+    attacks = table.get(key)
+    if attacks is None:
+        attacks = table[key] = _slide(sq, key, BISHOP_RAYS)
+    return attacks
+
+
+def queen_attacks(sq, occupied):
+    """
+    Squares a queen on sq attacks.
+    :param sq: int
+    :param occupied: bitboard of every piece
+    :return: bitboard
+    """
+    return rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
@@ -0,0 +1,862 @@
+"""
+Headless chess rules. Board holds the position and generates legal moves without touching pygame, sprites or
+images, so games can be validated and simulated on machines with no display. The pygame layer in data.py and
+pieces.py is a view over this module.
+
+Squares are indexed 0-63 as y * 8 + x using the same (x, y) cell grid as the UI, so (0, 0) is the top left
+cell (a8) and White pawns move towards y = 0. Alongside the square array the position is kept as one bitboard
+per piece, which is what move generation works from, and as a Zobrist hash that make_move and unmake_move
+keep up to date.
+"""
+from array import array
+
+from bitboard import *
+from zobrist import TURN_KEY, castle_keys, passant_keys, piece_keys
+
+WHITE = 'White'
+BLACK = 'Black'
+
+PAWN = 'Pawn'
+KNIGHT = 'Knight'
+BISHOP = 'Bishop'
+ROOK = 'Rook'
+QUEEN = 'Queen'
+KING = 'King'
+
+# castling rights bitmask
+WHITE_KINGSIDE = 1
+WHITE_QUEENSIDE = 2
+BLACK_KINGSIDE = 4
+BLACK_QUEENSIDE = 8
+
+PIECE_TYPES = (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING)
+PIECES = tuple((color, piece_type) for color in (WHITE, BLACK) for piece_type in PIECE_TYPES)
+PAWN_ATTACKS = {WHITE: WHITE_PAWN_ATTACKS, BLACK: BLACK_PAWN_ATTACKS}
+
+PIECE_KEYS = {(color, piece_type): piece_keys(2 * n + (color == WHITE))
+              for color in (WHITE, BLACK) for n, piece_type in enumerate(PIECE_TYPES)}
+CASTLE_KEYS = castle_keys()
+PASSANT_KEYS = passant_keys()
+
+PROMOTIONS = (QUEEN, ROOK, BISHOP, KNIGHT)
+CAPTURE_FLAG = 1 << 15  # set in a packed move that takes a piece
+
+# one byte per square in a PackedPosition: 0 for empty, 1-12 for each piece in PIECES order
+PIECE_CODES = {piece: code for code, piece in enumerate(PIECES, 1)}
+CODE_PIECES = (None,) + PIECES
+
+PIECE_LETTERS = {PAWN: 'p', KNIGHT: 'n', BISHOP: 'b', ROOK: 'r', QUEEN: 'q', KING: 'k'}
+LETTER_PIECES = {letter: piece_type for piece_type, letter in PIECE_LETTERS.items()}
+
+CASTLE_LETTERS = {'K': WHITE_KINGSIDE, 'Q': WHITE_QUEENSIDE, 'k': BLACK_KINGSIDE, 'q': BLACK_QUEENSIDE}
+
+# castling right, king square, rook square
+CASTLE_HOMES = ((WHITE_KINGSIDE, 60, 63), (WHITE_QUEENSIDE, 60, 56), (BLACK_KINGSIDE, 4, 7), (BLACK_QUEENSIDE, 4, 0))
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+LIGHT_SQUARES = sum(1 << sq for sq in range(64) if (sq % 8 + sq // 8) % 2 == 0)
+LAST_ROWS = 0xFF | 0xFF << 56  # first and last rows, where pawns can't stand
+
+# castling rights that survive a move touching each square
+CASTLE_MASK = [15] * 64
+CASTLE_MASK[0] = 15 & ~BLACK_QUEENSIDE
+CASTLE_MASK[4] = 15 & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+CASTLE_MASK[7] = 15 & ~BLACK_KINGSIDE
+CASTLE_MASK[56] = 15 & ~WHITE_QUEENSIDE
+CASTLE_MASK[60] = 15 & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+CASTLE_MASK[63] = 15 & ~WHITE_KINGSIDE
+
+# ways a game can be drawn without stalemate
+FIFTY_MOVES = 'Fifty-move rule'
+REPETITION = 'Threefold repetition'
+INSUFFICIENT = 'Insufficient material'
+
+
+def square(cell):
+    """
+    Converts an (x, y) cell to a 0-63 square index.
+    :param cell: tuple
+    :return: int
+    """
+    return cell[1] * 8 + cell[0]
+
+
+def cell(sq):
+    """
+    Converts a 0-63 square index back to an (x, y) cell.
+    :param sq: int
+    :return: tuple
+    """
+    return sq % 8, sq // 8
+
+
+def square_name(sq):
+    """
+    Algebraic name of a square, e.g. 'e4'.
+    :param sq: int
+    :return: str
+    """
+    return 'abcdefgh'[sq % 8] + str(8 - sq // 8)
+
+
+def square_from_name(name):
+    """
+    Square index for an algebraic name such as 'e4'.
+    :param name: str
+    :return: int
+    """
+    return (8 - int(name[1])) * 8 + 'abcdefgh'.index(name[0])
+
+
+def move_name(move):
+    """
+    Coordinate notation for a move, e.g. 'e2e4' or 'e7e8q'.
+    :param move: (from_square, to_square, promotion)
+    :return: str
+    """
+    origin, target, promotion = move
+    name = square_name(origin) + square_name(target)
+    if promotion:
+        name += PIECE_LETTERS[promotion]
+    return name
+
+
+def pack_move(move, capture=False):
+    """
+    Packs a move into 16 bits: 6 for each square, 3 for the promotion and the top bit for CAPTURE_FLAG.
+    :param move: (from_square, to_square, promotion), or None
+    :param capture: True if the move takes a piece
+    :return: int, 0 for None
+    """
+    if move is None:
+        return 0
+    origin, target, promotion = move
+    return origin | target << 6 | (PROMOTIONS.index(promotion) + 1 if promotion else 0) << 12 | \
+        (CAPTURE_FLAG if capture else 0)
+
+
+def unpack_move(packed):
+    """
+    Reverses pack_move. The capture flag is dropped.
+    :param packed: int
+    :return: move, or None
+    """
+    if not packed:
+        return None
+    promotion = packed >> 12 & 7
+    return packed & 63, packed >> 6 & 63, PROMOTIONS[promotion - 1] if promotion else None
+
+
+def changed_squares(origin, target, captured_square, piece_type):
+    """
+    Bitboard of every square whose contents a move changes, including the rook's squares when castling.
+    :param origin: int
+    :param target: int
+    :param captured_square: square a capture is made on (the target unless En Passant)
+    :param piece_type: type of the piece moved
+    :return: bitboard
+    """
+    changed = (1 << origin) | (1 << target) | (1 << captured_square)
+    if piece_type == KING and abs(target - origin) == 2:
+        if target > origin:
+            changed |= (1 << target + 1) | (1 << target - 1)
+        else:
+            changed |= (1 << target - 2) | (1 << target + 1)
+    return changed
+
+
+def king_piece(right):
+    """
+    The king a castling right belongs to.
+    :param right: castling right bit
+    :return: (color, 'King')
+    """
+    return (WHITE, KING) if right in (WHITE_KINGSIDE, WHITE_QUEENSIDE) else (BLACK, KING)
+
+
+def opponent(color):
+    """
+    Returns the other color.
+    :param color: 'White' / 'Black'
+    :return:
+    """
+    return BLACK if color == WHITE else WHITE
+
+
+class PackedPosition:
+    """
+    Compact record of a position, for keeping many of them: one byte per square (see PIECE_CODES), an int
+    holding the side to move (bit 0, set for Black), castling rights (bits 1-4), En Passant square plus one
+    (bits 5-11, 0 for none), halfmove clock (bits 12-27) and fullmove number (from bit 28), and the hash.
+    Made by Board.pack and read back by Board.set_packed.
+    """
+
+    __slots__ = ('squares', 'state', 'hash')
+
+    def __init__(self, squares, state, hash):
+        """
+        :param squares: bytes, 64 piece codes
+        :param state: int
+        :param hash: Zobrist key
+        """
+        self.squares = squares
+        self.state = state
+        self.hash = hash
+
+    def __eq__(self, other):
+        return isinstance(other, PackedPosition) and self.hash == other.hash and self.state == other.state and \
+            self.squares == other.squares
+
+    def __hash__(self):
+        return self.hash
+
+
+class Board:
+    """
+    Position and rules for a game of chess. Moves are (from_square, to_square, promotion) tuples, promotion
+    being the piece type a pawn becomes on the last row or None. make_move and unmake_move play and take back
+    moves in place, keeping an undo stack in history. Move generation, make_move and history all work on these
+    tuples. Where moves and positions are stored rather than played, packed_moves gives move lists as arrays of
+    16-bit ints (see pack_move) and pack gives a PackedPosition.
+    """
+
+    __slots__ = ('squares', 'bitboards', 'occupancy', 'turn', 'castling', 'passant', 'halfmove_clock',
+                 'fullmove_number', 'kings', 'hash', 'history', 'repetitions', 'attack_map')
+
+    def __init__(self):
+        """
+        Creates an empty board. Use reset() for the standard starting position.
+        squares holds (color, piece_type) tuples or None for every square, bitboards holds a bitboard for each
+        (color, piece_type) and occupancy the union of each color's bitboards.
+        """
+        self.squares = [None] * 64
+        self.bitboards = dict.fromkeys(PIECES, 0)
+        self.occupancy = {WHITE: 0, BLACK: 0}
+        self.turn = WHITE
+        self.castling = 0
+        self.passant = None  # square a pawn can move to for En Passant
+        self.halfmove_clock = 0  # plies since the last capture or pawn move
+        self.fullmove_number = 1
+        self.kings = {WHITE: None, BLACK: None}
+        self.hash = TURN_KEY  # Zobrist key, see compute_hash
+        self.history = []
+        self.repetitions = {}  # how many times each position hash has occurred, the current one included
+        self.attack_map = None  # optional attacks.AttackMap kept up to date by make_move / unmake_move
+
+    def reset(self):
+        """
+        Sets up the standard starting position.
+        :return:
+        """
+        self.set_fen(START_FEN)
+
+    def set_fen(self, fen):
+        """
+        Sets up the position described by a FEN string: piece placement, side to move, castling rights, the
+        En Passant square and the halfmove clock and fullmove number (which default to 0 and 1 if left off).
+        Castling rights are dropped for any king or rook that isn't on its starting square. Raises ValueError for
+        a malformed FEN, pawns on the first or last row, more than one king of a color, an En Passant square
+        with no pawn just pushed past it, or the side not to move being in check.
+        :param fen: str
+        :return:
+        """
+        fields = fen.split()
+        if len(fields) not in (4, 6):
+            raise ValueError('FEN needs 4 or 6 fields: ' + fen)
+        placement, side, castling, passant = fields[:4]
+        counters = fields[4:] or ['0', '1']
+        if not all(counter.isdigit() for counter in counters):
+            raise ValueError('Bad move counters: ' + ' '.join(counters))
+        self.__init__()
+        self.halfmove_clock, self.fullmove_number = int(counters[0]), max(1, int(counters[1]))
+        rows = placement.split('/')
+        if len(rows) != 8:
+            raise ValueError('FEN needs 8 rows: ' + fen)
+        for y, row in enumerate(rows):
+            x = 0
+            for char in row:
+                if char.isdigit():
+                    x += int(char)
+                elif char.lower() in LETTER_PIECES and x < 8:
+                    self.put(y * 8 + x, (WHITE if char.isupper() else BLACK, LETTER_PIECES[char.lower()]))
+                    x += 1
+                else:
+                    raise ValueError('Bad FEN row: ' + row)
+            if x != 8:
+                raise ValueError('Bad FEN row: ' + row)
+        if (self.bitboards[(WHITE, PAWN)] | self.bitboards[(BLACK, PAWN)]) & LAST_ROWS:
+            raise ValueError('Pawns can\'t stand on the first or last row: ' + placement)
+        for color in (WHITE, BLACK):
+            if count(self.bitboards[(color, KING)]) > 1:
+                raise ValueError('More than one {} King: {}'.format(color, placement))
+        if side not in ('w', 'b'):
+            raise ValueError('Bad side to move: ' + side)
+        self.turn = WHITE if side == 'w' else BLACK
+        for char in castling.replace('-', ''):
+            if char not in CASTLE_LETTERS:
+                raise ValueError('Bad castling rights: ' + castling)
+            self.castling |= CASTLE_LETTERS[char]
+        for right, king, rook in CASTLE_HOMES:
+            if self.squares[king] != king_piece(right) or self.squares[rook] != (king_piece(right)[0], ROOK):
+                self.castling &= ~right
+        if passant != '-':
+            if len(passant) != 2 or passant[0] not in 'abcdefgh' or passant[1] != ('6' if side == 'w' else '3'):
+                raise ValueError('Bad En Passant square: ' + passant)
+            self.passant = square_from_name(passant)
+            # the pawn that was just pushed two squares stands in front of the square it passed
+            step = 8 if self.turn == WHITE else -8
+            if self.squares[self.passant + step] != (opponent(self.turn), PAWN) or \
+                    self.squares[self.passant] is not None or self.squares[self.passant - step] is not None:
+                raise ValueError('No pawn just pushed past En Passant square: ' + passant)
+        if self.in_check(opponent(self.turn)):
+            raise ValueError('Side not to move is in check: ' + fen)
+        self.hash = self.compute_hash()
+        self.repetitions = {self.hash: 1}
+
+    def fen(self):
+        """
+        Describes the position as a FEN string.
+        :return: str
+        """
+        rows = []
+        for y in range(8):
+            row = ''
+            empty = 0
+            for x in range(8):
+                piece = self.squares[y * 8 + x]
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    row += str(empty)
+                    empty = 0
+                letter = PIECE_LETTERS[piece[1]]
+                row += letter.upper() if piece[0] == WHITE else letter
+            if empty:
+                row += str(empty)
+            rows.append(row)
+        castling = ''.join(letter for letter, right in CASTLE_LETTERS.items() if self.castling & right) or '-'
+        passant = square_name(self.passant) if self.passant is not None else '-'
+        return ' '.join(['/'.join(rows), 'w' if self.turn == WHITE else 'b', castling, passant,
+                         str(self.halfmove_clock), str(self.fullmove_number)])
+
+    def pack(self):
+        """
+        Describes the position as a PackedPosition. Like fen, it leaves out the history.
+        :return: PackedPosition
+        """
+        squares = bytes(PIECE_CODES[piece] if piece else 0 for piece in self.squares)
+        passant = self.passant + 1 if self.passant is not None else 0
+        state = (self.turn == BLACK) | self.castling << 1 | passant << 5 | self.halfmove_clock << 12 | \
+            self.fullmove_number << 28
+        return PackedPosition(squares, state, self.hash)
+
+    def set_packed(self, packed):
+        """
+        Sets up the position a PackedPosition describes, with an empty history as after set_fen.
+        :param packed: PackedPosition
+        :return:
+        """
+        self.__init__()
+        for sq, code in enumerate(packed.squares):
+            if code:
+                self.put(sq, CODE_PIECES[code])
+        state = packed.state
+        self.turn = BLACK if state & 1 else WHITE
+        self.castling = state >> 1 & 15
+        self.passant = (state >> 5 & 127) - 1 if state >> 5 & 127 else None
+        self.halfmove_clock = state >> 12 & 0xFFFF
+        self.fullmove_number = state >> 28
+        self.hash = packed.hash
+        self.repetitions = {self.hash: 1}
+
+    def compute_hash(self):
+        """
+        Zobrist key of the position worked out from scratch: every piece on its square, the castling rights,
+        the En Passant file when the side to move has a pawn that can actually make the capture, and whether
+        White is to move.
+        :return: 64-bit int
+        """
+        key = CASTLE_KEYS[self.castling]
+        for sq in self.occupied():
+            key ^= PIECE_KEYS[self.squares[sq]][sq]
+        if self.passant_capturable():
+            key ^= PASSANT_KEYS[self.passant % 8]
+        if self.turn == WHITE:
+            key ^= TURN_KEY
+        return key
+
+    def passant_capturable(self):
+        """
+        Determines if a pawn of the side to move stands next to a pawn that just moved two squares.
+        :return: True / False
+        """
+        if self.passant is None:
+            return False
+        pusher = WHITE if self.passant >= 32 else BLACK
+        return PAWN_ATTACKS[pusher][self.passant] & self.bitboards[(self.turn, PAWN)] != 0
+
+    def copy(self):
+        """
+        Returns an independent copy of the position.
+        :return: Board
+        """
+        board = Board.__new__(Board)
+        board.squares = self.squares.copy()
+        board.bitboards = self.bitboards.copy()
+        board.occupancy = self.occupancy.copy()
+        board.turn = self.turn
+        board.castling = self.castling
+        board.passant = self.passant
+        board.halfmove_clock = self.halfmove_clock
+        board.fullmove_number = self.fullmove_number
+        board.kings = self.kings.copy()
+        board.hash = self.hash
+        board.history = self.history.copy()
+        board.repetitions = self.repetitions.copy()
+        board.attack_map = None
+        return board
+
+    def put(self, sq, piece):
+        """
+        Places piece on a square, replacing anything already there.
+        :param sq: int
+        :param piece: (color, piece_type) tuple
+        :return:
+        """
+        if self.squares[sq] is not None:
+            self.remove(sq)
+        self.squares[sq] = piece
+        self.bitboards[piece] |= 1 << sq
+        self.occupancy[piece[0]] |= 1 << sq
+        if piece[1] == KING:
+            self.kings[piece[0]] = sq
+
+    def remove(self, sq):
+        """
+        Takes whatever piece is on a square off the board.
+        :param sq: int
+        :return: the removed (color, piece_type), or None
+        """
+        piece = self.squares[sq]
+        if piece is not None:
+            self.squares[sq] = None
+            self.bitboards[piece] &= ~(1 << sq)
+            self.occupancy[piece[0]] &= ~(1 << sq)
+        return piece
+
+    def piece_at(self, sq):
+        """
+        Returns the (color, piece_type) on a square, or None if empty.
+        :param sq: int
+        :return:
+        """
+        return self.squares[sq]
+
+    def occupied(self):
+        """
+        Returns every occupied square.
+        :return: list of int
+        """
+        return squares_of(self.occupancy[WHITE] | self.occupancy[BLACK])
+
+    def attacks_from(self, sq):
+        """
+        Squares attacked by the piece on sq, including squares holding ally pieces (protected squares).
+        :param sq: int
+        :return: bitboard
+        """
+        color, piece_type = self.squares[sq]
+        if piece_type == PAWN:
+            return PAWN_ATTACKS[color][sq]
+        if piece_type == KNIGHT:
+            return KNIGHT_ATTACKS[sq]
+        if piece_type == KING:
+            return KING_ATTACKS[sq]
+        occupied = self.occupancy[WHITE] | self.occupancy[BLACK]
+        if piece_type == ROOK:
+            return rook_attacks(sq, occupied)
+        if piece_type == BISHOP:
+            return bishop_attacks(sq, occupied)
+        return queen_attacks(sq, occupied)
+
+    def attackers(self, sq, by_color, occupied=None):
+        """
+        Pieces of by_color attacking a square, found by looking outwards from the square with each piece's
+        attack pattern.
+        :param sq: int
+        :param by_color: 'White' / 'Black'
+        :param occupied: occupancy to slide through, the current board if not given
+        :return: bitboard
+        """
+        bitboards = self.bitboards
+        if occupied is None:
+            occupied = self.occupancy[WHITE] | self.occupancy[BLACK]
+        defender = BLACK if by_color == WHITE else WHITE
+        queens = bitboards[(by_color, QUEEN)]
+        return (PAWN_ATTACKS[defender][sq] & bitboards[(by_color, PAWN)]) \
+            | (KNIGHT_ATTACKS[sq] & bitboards[(by_color, KNIGHT)]) \
+            | (KING_ATTACKS[sq] & bitboards[(by_color, KING)]) \
+            | (rook_attacks(sq, occupied) & (bitboards[(by_color, ROOK)] | queens)) \
+            | (bishop_attacks(sq, occupied) & (bitboards[(by_color, BISHOP)] | queens))
+
+    def is_attacked(self, sq, by_color):
+        """
+        Determines if any piece of by_color attacks the square.
+        :param sq: int
+        :param by_color: 'White' / 'Black'
+        :return: True / False
+        """
+        return self.attackers(sq, by_color) != 0
+
+    def attacked_squares(self, by_color):
+        """
+        Every square attacked by at least one piece of by_color.
+        :param by_color: 'White' / 'Black'
+        :return: bitboard
+        """
+        attacked = 0
+        for origin in squares_of(self.occupancy[by_color]):
+            attacked |= self.attacks_from(origin)
+        return attacked
+
+    def in_check(self, color=None):
+        """
+        Determines if the king of color (side to move by default) is attacked.
+        :param color: 'White' / 'Black'
+        :return: True / False
+        """
+        if color is None:
+            color = self.turn
+        king = self.kings[color]
+        if king is None:
+            return False
+        if self.attack_map is not None:
+            return self.attack_map.is_attacked(king, opponent(color))
+        return self.is_attacked(king, opponent(color))
+
+    def pseudo_moves_from(self, sq):
+        """
+        Moves the piece on sq could make ignoring self-check.
+        :param sq: int
+        :return: list of moves
+        """
+        color, piece_type = self.squares[sq]
+        own = self.occupancy[color]
+        if piece_type == PAWN:
+            enemy = self.occupancy[opponent(color)]
+            empty = ~(own | enemy)
+            if color == WHITE:
+                single = (1 << sq >> 8) & empty
+                double = (single >> 8) & empty if 48 <= sq < 56 else 0
+            else:
+                single = (1 << sq << 8) & empty
+                double = (single << 8) & empty if 8 <= sq < 16 else 0
+            if self.passant is not None and (self.passant < 32) == (color == WHITE):
+                enemy |= 1 << self.passant
+            targets = single | double | (PAWN_ATTACKS[color][sq] & enemy)
+            if targets & LAST_ROWS:
+                return [(sq, target, promotion) for target in squares_of(targets) for promotion in PROMOTIONS]
+        else:
+            targets = self.attacks_from(sq) & ~own
+        moves = [(sq, target, None) for target in squares_of(targets)]
+        if piece_type == KING:
+            moves.extend(self.castle_moves(color))
+        return moves
+
+    def castle_moves(self, color):
+        """
+        Castling moves available to color. The king may not castle out of, through or into check.
+        :param color: 'White' / 'Black'
+        :return: list of moves
+        """
+        if color == WHITE:
+            row, kingside, queenside = 56, WHITE_KINGSIDE, WHITE_QUEENSIDE
+        else:
+            row, kingside, queenside = 0, BLACK_KINGSIDE, BLACK_QUEENSIDE
+        king = row + 4
+        if not self.castling & (kingside | queenside) or self.kings[color] != king:
+            return []
+        enemy = opponent(color)
+        if self.attack_map is not None:
+            is_attacked = self.attack_map.is_attacked
+        else:
+            is_attacked = self.is_attacked
+        if is_attacked(king, enemy):
+            return []
+        moves = []
+        occupied = self.occupancy[WHITE] | self.occupancy[BLACK]
+        if self.castling & kingside and not occupied & (0b01100000 << row) \
+                and not is_attacked(row + 5, enemy) and not is_attacked(row + 6, enemy):
+            moves.append((king, row + 6, None))
+        if self.castling & queenside and not occupied & (0b00001110 << row) \
+                and not is_attacked(row + 3, enemy) and not is_attacked(row + 2, enemy):
+            moves.append((king, row + 2, None))
+        return moves
+
+    def king_safety(self, color):
+        """
+        Works out once per position what limits color's moves: the pieces giving check, the squares a
+        non-king move must land on to deal with that check, and each pinned piece with the ray it is allowed
+        to move along.
+        :param color: 'White' / 'Black'
+        :return: (king square, checkers bitboard, check mask bitboard, {pinned square: pin ray bitboard})
+        """
+        king = self.kings[color]
+        if king is None:
+            return None, 0, FULL, {}
+        enemy = opponent(color)
+        bitboards = self.bitboards
+        occupied = self.occupancy[WHITE] | self.occupancy[BLACK]
+        checkers = self.attackers(king, enemy, occupied)
+        if not checkers:
+            check_mask = FULL
+        elif checkers & (checkers - 1):
+            check_mask = 0  # double check, only the king can move
+        else:
+            check_mask = checkers | BETWEEN[king][lsb(checkers)]
+
+        pins = {}
+        queens = bitboards[(enemy, QUEEN)]
+        enemy_occupied = self.occupancy[enemy]
+        snipers = (rook_attacks(king, enemy_occupied) & (bitboards[(enemy, ROOK)] | queens)) \
+            | (bishop_attacks(king, enemy_occupied) & (bitboards[(enemy, BISHOP)] | queens))
+        own = self.occupancy[color]
+        for sniper in squares_of(snipers):
+            between = BETWEEN[king][sniper]
+            blockers = between & occupied
+            if blockers & own and not blockers & (blockers - 1):
+                pins[lsb(blockers)] = between | (1 << sniper)
+        return king, checkers, check_mask, pins
+
+    def legal_moves_from(self, sq, safety=None):
+        """
+        Legal moves for the piece on sq. Rather than playing each move out, pseudo-legal moves are filtered by
+        the check and pin rays from king_safety, and king moves by whether the target is attacked once the king
+        has left its square. En Passant, which removes two pieces from a rank at once, is the only move still
+        made and unmade to check it.
+        :param sq: int
+        :param safety: result of king_safety for the piece's color, worked out here if not given
+        :return: list of moves
+        """
+        piece = self.squares[sq]
+        if piece is None:
+            return []
+        color, piece_type = piece
+        if safety is None:
+            safety = self.king_safety(color)
+        king, checkers, check_mask, pins = safety
+        moves = self.pseudo_moves_from(sq)
+
+        if piece_type == KING:
+            enemy = opponent(color)
+            occupied = (self.occupancy[WHITE] | self.occupancy[BLACK]) & ~(1 << sq)
+            return [move for move in moves
+                    if abs(move[1] - sq) == 2 or not self.attackers(move[1], enemy, occupied)]
+
+        mask = check_mask & pins.get(sq, FULL)
+        legal = []
+        for move in moves:
+            target = move[1]
+            if piece_type == PAWN and target == self.passant and (target - sq) % 8:
+                self.make_move(move)
+                if not self.in_check(color):
+                    legal.append(move)
+                self.unmake_move()
+            elif mask >> target & 1:
+                legal.append(move)
+        return legal
+
+    def legal_moves(self, color=None):
+        """
+        Every legal move for color (side to move by default).
+        :param color: 'White' / 'Black'
+        :return: list of moves
+        """
+        if color is None:
+            color = self.turn
+        safety = self.king_safety(color)
+        moves = []
+        for sq in squares_of(self.occupancy[color]):
+            moves.extend(self.legal_moves_from(sq, safety))
+        return moves
+
+    def packed_moves(self, sq=None):
+        """
+        Legal moves packed into 16-bit ints (see pack_move) in an array, 2 bytes a move, with CAPTURE_FLAG set
+        on captures, En Passant included.
+        :param sq: square of the piece to list the moves of, or None for every move of the side to move
+        :return: array('H')
+        """
+        moves = self.legal_moves() if sq is None else self.legal_moves_from(sq)
+        squares = self.squares
+        passant = self.passant
+        return array('H', [pack_move(move, squares[move[1]] is not None or
+                                     move[1] == passant and squares[move[0]][1] == PAWN) for move in moves])
+
+    def has_legal_move(self, color=None):
+        """
+        Whether color (side to move by default) has at least one legal move. Stops at the first piece that has
+        one, starting with the king, which is the only piece that can move in double check.
+        :param color: 'White' / 'Black'
+        :return: True / False
+        """
+        if color is None:
+            color = self.turn
+        safety = self.king_safety(color)
+        king = self.kings[color]
+        if king is not None and self.legal_moves_from(king, safety):
+            return True
+        for sq in squares_of(self.occupancy[color]):
+            if sq != king and self.legal_moves_from(sq, safety):
+                return True
+        return False
+
+    def insufficient_material(self):
+        """
+        Whether neither side has the material left to checkmate: kings alone, a single knight or bishop, or
+        only bishops that all stand on squares of one color.
+        :return: True / False
+        """
+        bitboards = self.bitboards
+        for color in (WHITE, BLACK):
+            if bitboards[(color, PAWN)] | bitboards[(color, ROOK)] | bitboards[(color, QUEEN)]:
+                return False
+        knights = bitboards[(WHITE, KNIGHT)] | bitboards[(BLACK, KNIGHT)]
+        bishops = bitboards[(WHITE, BISHOP)] | bitboards[(BLACK, BISHOP)]
+        if count(knights | bishops) <= 1:
+            return True
+        return not knights and (not bishops & LIGHT_SQUARES or not bishops & ~LIGHT_SQUARES)
+
+    def draw_reason(self):
+        """
+        Why the position is drawn by rule, other than stalemate, which needs the legal moves. Each test is a
+        lookup: the halfmove clock, the count of the current hash in repetitions and the piece bitboards.
+        :return: FIFTY_MOVES, REPETITION or INSUFFICIENT, or None if the game goes on
+        """
+        if self.halfmove_clock >= 100:
+            return FIFTY_MOVES
+        if self.repetitions.get(self.hash, 0) >= 3:
+            return REPETITION
+        if self.insufficient_material():
+            return INSUFFICIENT
+        return None
+
+    def _shift(self, origin, target):
+        """
+        Moves a piece between two squares, the target being empty.
+        :param origin: int
+        :param target: int
+        :return:
+        """
+        piece = self.squares[origin]
+        self.squares[origin] = None
+        self.squares[target] = piece
+        bits = (1 << origin) | (1 << target)
+        self.bitboards[piece] ^= bits
+        self.occupancy[piece[0]] ^= bits
+        if piece[1] == KING:
+            self.kings[piece[0]] = target
+
+    def make_move(self, move):
+        """
+        Plays a move, resolving captures, En Passant and castling, and passes the turn. Only the squares the
+        move touches are updated; what is needed to take it back is pushed onto history.
+        :param move: (from_square, to_square, promotion)
+        :return: square of the captured piece, or None
+        """
+        origin, target, promotion = move
+        piece = self.squares[origin]
+        color, piece_type = piece
+        key = self.hash ^ CASTLE_KEYS[self.castling]
+        if self.passant_capturable():
+            key ^= PASSANT_KEYS[self.passant % 8]
+        captured_square = target
+        captured_piece = self.squares[target]
+        if captured_piece is not None:
+            self.remove(target)
+            key ^= PIECE_KEYS[captured_piece][target]
+        self._shift(origin, target)
+        key ^= PIECE_KEYS[piece][origin]
+        if promotion:
+            self.remove(target)
+            self.put(target, (color, promotion))
+            key ^= PIECE_KEYS[(color, promotion)][target]
+        else:
+            key ^= PIECE_KEYS[piece][target]
+
+        passant = None
+        if piece_type == PAWN:
+            if target == self.passant and (target - origin) % 8:
+                captured_square = target + 8 if color == WHITE else target - 8
+                captured_piece = self.remove(captured_square)
+                key ^= PIECE_KEYS[captured_piece][captured_square]
+            elif abs(target - origin) == 16:
+                passant = (origin + target) // 2
+        elif piece_type == KING and abs(target - origin) == 2:
+            rook = (color, ROOK)
+            if target > origin:
+                self._shift(target + 1, target - 1)
+                key ^= PIECE_KEYS[rook][target + 1] ^ PIECE_KEYS[rook][target - 1]
+            else:
+                self._shift(target - 2, target + 1)
+                key ^= PIECE_KEYS[rook][target - 2] ^ PIECE_KEYS[rook][target + 1]
+        self.history.append((move, captured_piece, captured_square, self.castling, self.passant, self.turn,
+                             self.hash, self.halfmove_clock))
+        if piece_type == PAWN or captured_piece is not None:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if color == BLACK:
+            self.fullmove_number += 1
+        self.passant = passant
+        self.castling &= CASTLE_MASK[origin] & CASTLE_MASK[target]
+        turn = BLACK if color == WHITE else WHITE
+        if turn != self.turn:
+            key ^= TURN_KEY
+        self.turn = turn
+        key ^= CASTLE_KEYS[self.castling]
+        if passant is not None and self.passant_capturable():
+            key ^= PASSANT_KEYS[passant % 8]
+        self.hash = key
+        self.repetitions[key] = self.repetitions.get(key, 0) + 1
+        if self.attack_map is not None:
+            self.attack_map.update(changed_squares(origin, target, captured_square, piece_type))
+        if captured_piece is not None:
+            return captured_square
+
+    def unmake_move(self):
+        """
+        Takes back the last move made, restoring the position exactly.
+        :return: the move taken back
+        """
+        move, captured_piece, captured_square, castling, passant, turn, key, halfmove_clock = self.history.pop()
+        origin, target, promotion = move
+        seen = self.repetitions[self.hash] - 1
+        if seen:
+            self.repetitions[self.hash] = seen
+        else:
+            del self.repetitions[self.hash]
+        if promotion:
+            self.put(target, (self.squares[target][0], PAWN))
+        piece = self.squares[target]
+        self._shift(target, origin)
+        if captured_piece is not None:
+            self.put(captured_square, captured_piece)
+        if piece[1] == KING and abs(target - origin) == 2:
+            if target > origin:
+                self._shift(target - 1, target + 1)
+            else:
+                self._shift(target + 1, target - 2)
+        self.castling = castling
+        self.passant = passant
+        self.turn = turn
+        self.hash = key
+        self.halfmove_clock = halfmove_clock
+        if piece[0] == BLACK:
+            self.fullmove_number -= 1
+        if self.attack_map is not None:
+            self.attack_map.update(changed_squares(origin, target, captured_square, piece[1]))
+        return move
+
@@ -0,0 +1,210 @@
+"""
+Opening book. Books use the Polyglot file format: 16-byte big-endian entries of position key, move, weight
+and a learn field, sorted by key. The file is memory-mapped and binary searched, so opening a book costs
+nothing however big it is and only the pages a lookup touches are ever read.
+
+Position keys are board.py's Zobrist hashes, which use Polyglot's own Random64 table (see zobrist.py), so books
+built here and third-party Polyglot books both work. Runs headless, e.g.
+
+    python book.py build games.pgn book.bin --plies 16
+    python book.py probe book.bin --fen "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1"
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+
+from board import *
+from pgn import move_san, open_games, parse_san
+
+ENTRY = struct.Struct('>QHHI')  # key, move, weight, learn
+KEY = struct.Struct('>Q')
+PROMOTION_CODES = (None, KNIGHT, BISHOP, ROOK, QUEEN)
+WEIGHT_LIMIT = 0xFFFF
+
+
+def encode_move(board, move):
+    """
+    Polyglot's 16-bit move: to file, to row, from file, from row (rows counted from rank 1) and promotion,
+    3 bits each. Castling is written as the king taking its own rook.
+    :param board: Board the move is played in
+    :param move: (from_square, to_square, promotion), castling being the king moving two squares
+    :return: int
+    """
+    origin, target, promotion = move
+    piece = board.squares[origin]
+    if piece is not None and piece[1] == KING and origin in (4, 60) and abs(target - origin) == 2:
+        target = origin + 3 if target > origin else origin - 4
+    return (target % 8 | (7 - target // 8) << 3 | (origin % 8) << 6 | (7 - origin // 8) << 9 |
+            PROMOTION_CODES.index(promotion) << 12)
+
+
+def decode_move(board, code):
+    """
+    Reverses encode_move for a position, turning a king taking its own rook back into castling.
+    :param board: Board the move is played in
+    :param code: int
+    :return: move
+    """
+    target = (7 - (code >> 3 & 7)) * 8 + (code & 7)
+    origin = (7 - (code >> 9 & 7)) * 8 + (code >> 6 & 7)
+    promotion = PROMOTION_CODES[code >> 12 & 7] if code >> 12 & 7 < len(PROMOTION_CODES) else None
+    piece = board.squares[origin]
+    if piece is not None and piece[1] == KING and origin in (4, 60) and target in (origin + 3, origin - 4):
+        target = origin + 2 if target > origin else origin - 2
+    return origin, target, promotion
+
+
+class OpeningBook:
+    """
+    Read-only, memory-mapped Polyglot book.
+    """
+
+    def __init__(self, path):
+        """
+        Maps the book file. Nothing is read until a position is looked up.
+        :param path: str
+        """
+        self.path = path
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.size = size // ENTRY.size
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+    def __len__(self):
+        return self.size
+
+    def entries(self, key):
+        """
+        Book entries for a position key, found by binary search on the sorted file.
+        :param key: Zobrist hash
+        :return: list of (move code, weight)
+        """
+        data = self.data
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(data, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        while low < self.size:
+            entry_key, code, weight, learn = ENTRY.unpack_from(data, low * ENTRY.size)
+            if entry_key != key:
+                break
+            found.append((code, weight))
+            low += 1
+        return found
+
+    def moves(self, board):
+        """
+        Book moves for the board's position, heaviest first. Moves that aren't legal in the position (from a
+        key collision or a damaged file) are left out.
+        :param board: Board
+        :return: list of (move, weight)
+        """
+        legal = board.legal_moves()
+        moves = []
+        for code, weight in self.entries(board.hash):
+            move = decode_move(board, code)
+            if move in legal and weight:
+                moves.append((move, weight))
+        moves.sort(key=lambda entry: entry[1], reverse=True)
+        return moves
+
+    def pick(self, board, rng=random):
+        """
+        Chooses a book move at random, in proportion to the weights.
+        :param board: Board
+        :param rng: random number source
+        :return: move, or None if the position isn't in the book
+        """
+        moves = self.moves(board)
+        if not moves:
+            return None
+        return rng.choices([move for move, weight in moves], [weight for move, weight in moves])[0]
+
+    def close(self):
+        """
+        Unmaps the book and closes its file.
+        :return:
+        """
+        if self.size:
+            self.data.close()
+        self.file.close()
+
+
+def open_book(path):
+    """
+    Opens a book if the file exists.
+    :param path: str, or None
+    :return: OpeningBook, or None
+    """
+    if path and os.path.isfile(path):
+        return OpeningBook(path)
+    return None
+
+
+def build(pgn_path, book_path, plies=16):
+    """
+    Builds a book from the opening moves of the games in a PGN file. Each move scores 2 for a win and 1 for a
+    draw by the side that played it, the Polyglot convention, and weights are scaled down to fit in 16 bits.
+    :param pgn_path: str
+    :param book_path: str
+    :param plies: how many moves of each game go in the book
+    :return: number of entries written
+    """
+    written = 0
+    scores = {}
+    points = {'1-0': (2, 0), '0-1': (0, 2), '1/2-1/2': (1, 1)}
+    for game in open_games(pgn_path):
+        white, black = points.get(game.result, (0, 0))
+        board = game.start_board()
+        try:
+            for san in game.moves[:plies]:
+                move = parse_san(board, san)
+                entry = (board.hash, encode_move(board, move))
+                scores[entry] = scores.get(entry, 0) + (white if board.turn == WHITE else black)
+                board.make_move(move)
+        except ValueError:
+            continue
+    top = max(scores.values(), default=0)
+    scale = top / WEIGHT_LIMIT if top > WEIGHT_LIMIT else 1
+    with open(book_path, 'wb') as book:
+        for key, code in sorted(scores):
+            weight = int(scores[(key, code)] / scale)
+            if weight:
+                book.write(ENTRY.pack(key, code, weight, 0))
+                written += 1
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Build or look up a Polyglot opening book.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build_parser = commands.add_parser('build', help='build a book from a PGN file')
+    build_parser.add_argument('pgn', help='PGN file')
+    build_parser.add_argument('book', help='book file to write')
+    build_parser.add_argument('--plies', type=int, default=16, help='moves of each game to use')
+    probe_parser = commands.add_parser('probe', help='list the book moves for a position')
+    probe_parser.add_argument('book', help='book file')
+    probe_parser.add_argument('--fen', default=START_FEN, help='position to look up (default: starting position)')
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        print(build(args.pgn, args.book, args.plies), 'entries')
+        return 0
+    board = Board()
+    board.set_fen(args.fen)
+    book = OpeningBook(args.book)
+    for move, weight in book.moves(board):
+        print(move_san(board, move), weight)
+    book.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
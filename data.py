@@ -1,3 +1,6 @@
+from attacks import AttackMap
+from board import Board, START_FEN, cell, opponent, square, unpack_move
+from movecache import MoveCache
 from pieces import *
 
 
@@ -6,65 +9,47 @@ class GameData:
     Main data class for game.
     """
 
+    # legal moves per position, shared between games so revisited positions don't need regenerating
+    move_cache = MoveCache(MOVE_CACHE_SIZE)
+
     def __init__(self, game):
         """
-        Initialization of various data attributes. Notably there are 2 types of move banks.
-        "black/white attacking" is a move bank that includes attacking cells where ally pieces exist
-        as a means to evaluate protected cells. This is used in checking if a king can safely take a piece
-        without accidentally self-checking via another piece.
-        "verified black/white moves" is the actual list of cells that any piece can move on a turn. This is
-        used to see if any moves are available for a player and, if none are, is the way checkmate is determined.
+        Initialization of various data attributes. "black/white attacking" is a bitboard of attacked cells,
+        including cells where ally pieces exist as a means to evaluate protected cells. It comes from an attack
+        map on the board that is updated incrementally with every move, so checking a cell is a single bit test.
+        Legal moves are only worked out for the piece that is picked up. Whether the side to move has any move
+        at all, and so whether it is checkmated or stalemated, is decided by the rules core's has_legal_move.
+        The position itself lives in self.board, the headless rules core; everything here is a view over it.
         :param game: 
         """
+        self.board = Board()
         self.selected_piece = None
-        self.occupied_cells = []
+        self.piece_board = [None] * 64  # piece sprite on each rules core square
         self.highlighted_cells = []
-        self.black_attacking = []
-        self.white_attacking = []
-        self.verified_black_moves = []
-        self.verified_white_moves = []
-        self.passant = None
-        self.passant_pawn = None
         self.black_king = None  # special pointers to black and white kings
         self.white_king = None
         self.turn_order = True
-        self.turn = 'White'
+        self.engine_colors = set()  # colors the computer is playing
         self.winner = None
+        self.draw_reason = None  # why the game was drawn, when winner is 'Draw'
+        self.move_history = []  # sprites touched by each move, for unmake_move
         self.game = game
 
     @property
     def black_attacking(self):
         """
-        Returns black attacking data.
-        :return:
-        """
-        return self._black_attacking
-
-    @black_attacking.setter
-    def black_attacking(self, cell):
-        """
-        Adds cell as being attacked by at least 1 black piece.
-        :param cell: tuple
+        Returns bitboard of squares attacked by at least 1 black piece.
         :return:
         """
-        self._black_attacking = cell
+        return self.board.attack_map.attacked['Black']
 
     @property
     def white_attacking(self):
         """
-        Returns white attacking data.
+        Returns bitboard of squares attacked by at least 1 white piece.
         :return:
         """
-        return self._white_attacking
-
-    @white_attacking.setter
-    def white_attacking(self, cell):
-        """
-        Adds cell as being attacked by at least 1 white piece.
-        :param cell: tuple
-        :return:
-        """
-        self._white_attacking = cell
+        return self.board.attack_map.attacked['White']
 
     @property
     def selected_piece(self):
@@ -82,23 +67,6 @@ class GameData:
         """
         self._selected_piece = piece
 
-    @property
-    def occupied_cells(self):
-        """
-        Returns known occupied cells.
-        :return:
-        """
-        return self._occupied_cells
-
-    @occupied_cells.setter
-    def occupied_cells(self, cell):
-        """
-        Adds cell coord to occupied cell list.
-        :param cell: tuple
-        :return:
-        """
-        self._occupied_cells = cell
-
     @property
     def highlighted_cells(self):
         """
@@ -136,29 +104,19 @@ class GameData:
     @property
     def turn(self):
         """
-        Returns which player's turn it is.
-        :return:
-        """
-        return self._turn
-
-    @turn.setter
-    def turn(self, color):
-        """
-        Changes turn to given color.
-        :param color:
+        Returns which player's turn it is. The rules core passes the turn after every move.
         :return:
         """
-        self._turn = color
+        return self.board.turn
 
-    def change_turn(self):
+    @property
+    def position_hash(self):
         """
-        Changes turn upon completion of move.
+        Returns the 64-bit Zobrist key of the current position, kept up to date by the rules core on every
+        move and takeback.
         :return:
         """
-        if self.turn == 'White':
-            self.turn = 'Black'
-        elif self.turn == 'Black':
-            self.turn = 'White'
+        return self.board.hash
 
     @property
     def passant(self):
@@ -166,16 +124,8 @@ class GameData:
         Returns passant cell that is targetable.
         :return:
         """
-        return self._passant
-
-    @passant.setter
-    def passant(self, cell):
-        """
-        Sets up En Passant information for following turn.
-        :param cell: grid location where En Passant is possible
-        :return:
-        """
-        self._passant = cell
+        if self.board.passant is not None:
+            return cell(self.board.passant)
 
     @property
     def passant_pawn(self):
@@ -183,16 +133,9 @@ class GameData:
         Returns the pawn at risk from passant.
         :return:
         """
-        return self._passant_pawn
-
-    @passant_pawn.setter
-    def passant_pawn(self, piece):
-        """
-        Sets piece at risk of En Passant.
-        :param piece: Pawn
-        :return:
-        """
-        self._passant_pawn = piece
+        if self.board.passant is not None:
+            x, y = cell(self.board.passant)
+            return self.get_piece_from_coord((x, y - 1 if y == 5 else y + 1))
 
     @property
     def black_king(self):
@@ -226,57 +169,46 @@ class GameData:
         """
         self._white_king = obj
 
-    def scan_board(self):
+    def populate_board(self, fen=START_FEN):
         """
-        Clears occupied cells variable and repopulates it with current cells occupied by other pieces.
+        Sets the rules core to the position described by a FEN string and creates a sprite for each of its pieces.
+        :param fen: str, the starting position by default
         :return:
         """
-        self.occupied_cells.clear()
-        for sprite in self.game.all_sprites:
-            self.occupied_cells.append(sprite.cell_location)
+        self.board = self.board_from_fen(fen)
+        self.board.attack_map = AttackMap(self.board)
+        for sq in self.board.occupied():
+            color, piece_type = self.board.piece_at(sq)
+            piece = Piece(color, cell(sq), piece_type, image_name(color, piece_type), self)
+            self.game.all_sprites.add(piece)
+            self.piece_board[sq] = piece
+            if piece_type == 'King':
+                if color == 'Black':
+                    self.black_king = piece
+                else:
+                    self.white_king = piece
 
-    def populate_board(self):
+    @staticmethod
+    def board_from_fen(fen):
         """
-        Places initial pieces on the board, creating piece objects for each of them.
-        :return:
+        Builds a rules core board for a FEN string. Both kings have to be on the board, since check and mate are
+        judged from them.
+        :param fen: str
+        :return: Board, or raises ValueError if the FEN can't be played from
         """
+        board = Board()
+        board.set_fen(fen)
+        for color in ('White', 'Black'):
+            if board.kings[color] is None:
+                raise ValueError('No ' + color + ' king in FEN: ' + fen)
+        return board
 
-        # Back row starting positions
-        rooks = [('Black', (0, 0), 'br.svg'), ('Black', (7, 0), 'br.svg'),
-                 ('White', (0, 7), 'wr.svg'), ('White', (7, 7), 'wr.svg')]
-        knights = [('Black', (1, 0), 'bn.svg'), ('Black', (6, 0), 'bn.svg'),
-                   ('White', (1, 7), 'wn.svg'), ('White', (6, 7), 'wn.svg')]
-        bishops = [('Black', (2, 0), 'bb.svg'), ('Black', (5, 0), 'bb.svg'),
-                   ('White', (2, 7), 'wb.svg'), ('White', (5, 7), 'wb.svg')]
-        kings = [('Black', (4, 0), 'bk.svg'), ('White', (4, 7), 'wk.svg')]
-        queens = [('Black', (3, 0), 'bq.svg'), ('White', (3, 7), 'wq.svg')]
-
-        for element in rooks:
-            piece = Rook(element[0], element[1], 'Rook', element[2], self)
-            self.game.all_sprites.add(piece)
-
-        for element in knights:
-            piece = Knight(element[0], element[1], 'Knight', element[2], self)
-            self.game.all_sprites.add(piece)
-
-        for element in bishops:
-            piece = Bishop(element[0], element[1], 'Bishop', element[2], self)
-            self.game.all_sprites.add(piece)
-
-        for element in kings:
-            piece = King(element[0], element[1], 'King', element[2], self)
-            self.game.all_sprites.add(piece)
-
-        for element in queens:
-            piece = Queen(element[0], element[1], 'Queen', element[2], self)
-            self.game.all_sprites.add(piece)
-
-        # Pawn starting positions
-        for x in range(0, 8):
-            b_piece = Pawn('Black', (x, 1), 'Pawn', 'bp.svg', self)
-            w_piece = Pawn('White', (x, 6), 'Pawn', 'wp.svg', self)
-            self.game.all_sprites.add(b_piece)
-            self.game.all_sprites.add(w_piece)
+    def fen(self):
+        """
+        Returns the current position as a FEN string.
+        :return: str
+        """
+        return self.board.fen()
 
     @staticmethod
     def cell_pos(pos):
@@ -288,7 +220,7 @@ class GameData:
         x, y = pos
         x = (x - X_OFFSET) / TILESIZE
         y = (y - Y_OFFSET) / TILESIZE
-        if x < 0 or x > 8 or y < 0 or y > 8:
+        if x < 0 or x >= 8 or y < 0 or y >= 8:
             return None
         else:
             x, y = int(x), int(y)
@@ -325,79 +257,59 @@ class GameData:
         self._winner = color
 
     @property
-    def verified_black_moves(self):
-        """
-        Verified positions black can move on their turn.
-        :return:
-        """
-        return self._verified_black_moves
-
-    @verified_black_moves.setter
-    def verified_black_moves(self, cell):
-        """
-        List of verified positions at least 1 black piece can move.
-        :param cell: tuple
-        :return:
-        """
-        self._verified_black_moves = cell
-
-    @property
-    def verified_white_moves(self):
+    def draw_reason(self):
         """
-        Verified positions white can move on their turn.
+        Returns why the game was drawn: 'Stalemate', 'Fifty-move rule', etc.
         :return:
         """
-        return self._verified_white_moves
+        return self._draw_reason
 
-    @verified_white_moves.setter
-    def verified_white_moves(self, cell):
+    @draw_reason.setter
+    def draw_reason(self, reason):
         """
-        List of verified positions at least 1 white piece can move.
-        :param cell: tuple
+        Sets why the game was drawn.
+        :param reason: str, or None
         :return:
         """
-        self._verified_white_moves = cell
+        self._draw_reason = reason
 
-    def get_piece(self):
+    def get_piece(self, pos=None):
         """
-        Returns piece located at mouse pos.
-        :return:
+        Returns piece located at mouse pos, found by converting the pixel to a cell and indexing the square to
+        piece table rather than testing every sprite.
+        :param pos: pixel location, the mouse position by default
+        :return: Piece object, or None
         """
-        pos = pg.mouse.get_pos()
-        clicked_sprites = [s for s in self.game.all_sprites if s.rect.collidepoint(pos)]
-        if clicked_sprites:
-            return clicked_sprites[0]
-        else:
-            return None
+        if pos is None:
+            pos = pg.mouse.get_pos()
+        cell = self.cell_pos(pos)
+        if cell:
+            return self.get_piece_from_coord(cell)
+        return None
 
-    def get_rect(self):
+    def get_rect(self, pos=None):
         """
-        Returns the rect located at mouse pos.
-        :return:
+        Returns the rect located at mouse pos. Only the UI elements filed under the pixel's square of the
+        screen in the game's ui_index are tested.
+        :param pos: pixel location, the mouse position by default
+        :return: UI element, or None
         """
-        pos = pg.mouse.get_pos()
-        clicked_rect = [r for r in self.game.ui if r.box.collidepoint(pos)]
-        if clicked_rect:
-            return clicked_rect[0]
-        else:
-            return None
+        if pos is None:
+            pos = pg.mouse.get_pos()
+        x, y = pos
+        for element in self.game.ui_index.get((int(x // TILESIZE), int(y // TILESIZE)), ()):
+            if element.box.collidepoint(pos):
+                return element
+        return None
 
     def get_piece_from_coord(self, coord):
         """
-        Returns piece object from given Coord. In the event that two pieces occupy the same cell (which
-        happens during move simulation), precedence is given to Kings. This fixes an issue with detecting
-        check / checkmate.
+        Returns piece object from given Coord by indexing the square to piece table, which follows the rules
+        core rather than where sprites are drawn, so a piece being dragged over the cell is never returned.
         :param coord: cell to check, based on grid coords, not pixel coords
         :return: Piece object
         """
-        if self.black_king.cell_location == coord:
-            return self.black_king
-        elif self.white_king.cell_location == coord:
-            return self.white_king
-        else:
-            for sprite in self.game.all_sprites:
-                if sprite.cell_location == coord:
-                    return sprite
+        return self.piece_board[square(coord)]
 
     def find_closest_cell(self, piece):
         """
@@ -414,80 +326,188 @@ class GameData:
             else:
                 return piece.previous_pixel
 
-    def update_move_banks(self, exclude=None):
+    def play_move(self, piece, destination):
         """
-        Cycles through all pieces and updates move banks.
-        :param exclude: optional. if given, will exclude that piece from move updates.
+        Plays a verified move for a dropped piece. Pawns reaching the last row are promoted to Queens.
+        :param piece: piece being moved
+        :param destination: destination cell
         :return:
         """
-        self.black_attacking.clear(), self.white_attacking.clear()
-        for sprite in self.game.all_sprites:
-            if sprite != exclude:
-                sprite.move_bank.clear()
-                if sprite.cell_location is not None:
-                    sprite.update_move_bank()
+        promotion = None
+        if piece.piece_type == 'Pawn' and destination[1] in (0, 7):
+            promotion = 'Queen'
+        self.make_move((piece.square, square(destination), promotion))
 
-    def clear_team_move_banks(self):
+    def make_move(self, move):
+        """
+        Plays a move in the rules core and moves only the sprites it touches: the piece itself, any captured
+        piece and the rook when castling. Can be taken back with unmake_move.
+        :param move: (from_square, to_square, promotion)
+        :return: captured piece, or None
         """
-        Clears verified move banks of teams.
+        origin, target, promotion = move
+        piece = self.get_piece_from_coord(cell(origin))
+        captured_piece = None
+        captured = self.board.make_move(move)
+        if captured is not None:
+            captured_piece = self.get_piece_from_coord(cell(captured))
+        self.place_piece(piece, target)
+        if promotion:
+            piece.change_type(promotion)
+        self.resolve_attack(captured_piece)
+        if piece.piece_type == 'King' and abs(target - origin) == 2:
+            self.resolve_castle(piece)
+        self.move_history.append((piece, captured_piece, captured))
+        return captured_piece
+
+    def unmake_move(self):
+        """
+        Takes back the last move, restoring the rules core and the sprites it touched.
+        :return: the move taken back, or None if no moves have been made
+        """
+        if not self.move_history:
+            return None
+        move = self.board.unmake_move()
+        piece, captured_piece, captured = self.move_history.pop()
+        origin, target, promotion = move
+        if promotion:
+            piece.change_type('Pawn')
+        if piece.piece_type == 'King' and abs(target - origin) == 2:
+            self.resolve_castle(piece, undo=True)
+        self.place_piece(piece, origin)
+        if captured_piece:
+            self.restore_capture(captured_piece, captured)
+        return move
+
+    def place_piece(self, piece, sq):
+        """
+        Puts a sprite on the cell for a rules core square, marking where it was drawn and the new cell for
+        repainting.
+        :param piece: Piece
+        :param sq: int
         :return:
         """
-        self.verified_white_moves.clear()
-        self.verified_black_moves.clear()
+        self.game.mark_dirty(piece.rect)
+        if piece.square is not None and self.piece_board[piece.square] is piece:
+            self.piece_board[piece.square] = None
+        self.piece_board[sq] = piece
+        piece.square = sq
+        piece.cell_location = cell(sq)
+        piece.pixel_location = self.global_pos(piece.cell_location)
+        self.game.mark_dirty(self.game.cell_rect(piece.cell_location))
 
-    def resolve_attack(self, piece, passant):
+    def resolve_castle(self, king, undo=False):
         """
-        Checks if there is a collision between two chess pieces and resolves it.
-        :param piece: piece most recently moved
-        :param passant: if to allow passant kills
+        Moves the rook sprite next to a king that just castled, or back to its corner if the castle is being
+        taken back.
+        :param king: King piece
+        :param undo: True when taking the castle back
+        :return:
+        """
+        x, y = cell(king.square)
+        corner, beside = ((0, y), (3, y)) if x == 2 else ((7, y), (5, y))
+        if undo:
+            corner, beside = beside, corner
+        self.place_piece(self.get_piece_from_coord(corner), square(beside))
+
+    def verified_moves(self, sq):
+        """
+        Legal moves for the piece on a square in the current position. They are kept in move_cache by position
+        hash and square, so only pieces that are actually picked up ever have their moves generated and every
+        lookup counts as a hit or miss for that piece alone. They are stored as the rules core's packed move
+        arrays, 2 bytes a move.
+        :param sq: square of the piece
+        :return: array of packed moves
+        """
+        board = self.board
+        key = (board.hash, board.passant, sq)
+        moves = self.move_cache.get(key)
+        if moves is None:
+            moves = board.packed_moves(sq)
+            self.move_cache.put(key, moves)
+        return moves
+
+    def update_verified_moves(self, piece):
+        """
+        Gives a piece its verified move bank for the current position, the cells it can move to (its highlight
+        set), used when it is picked up. Pawns are always promoted to Queens so other promotions are left out.
+        :param piece: Piece
+        :return:
+        """
+        moves = map(unpack_move, self.verified_moves(piece.square))
+        piece.verified_move_bank = [cell(target) for _, target, promotion in moves if promotion in (None, 'Queen')]
+
+    def resolve_attack(self, captured_piece):
+        """
+        Moves a piece the rules core captured off the board and into its team's captured box.
+        :param captured_piece: piece that was captured, or None
         :return:
         """
-        captured_piece = None
         black_captures = self.game.ui[2]
         white_captures = self.game.ui[3]
-        if piece:
-            if passant:
-                if piece.color != self.passant_pawn.color:
-                    captured_piece = self.passant_pawn
-            for sprite in self.game.all_sprites:
-                if sprite is not piece:
-                    if sprite.pixel_location == piece.pixel_location:
-                        if sprite.color != piece.color:
-                            captured_piece = sprite
-            if captured_piece:
-                if captured_piece.color != piece.color:
-                    captured_piece.kill()
-                    self.game.captured_sprites.add(captured_piece)
-                    captured_piece.change_transform(int(TILESIZE / 2))
-                    if captured_piece.color == 'Black':
-                        print('Black', captured_piece.piece_type, 'captured!')
-                        captured_piece.pixel_location = white_captures.next_box_position
-                        white_captures.set_next_box_position()
-                    elif captured_piece.color == 'White':
-                        print('White', captured_piece.piece_type, 'captured!')
-                        captured_piece.pixel_location = black_captures.next_box_position
-                        black_captures.set_next_box_position()
+        if captured_piece:
+            if self.piece_board[captured_piece.square] is captured_piece:
+                self.piece_board[captured_piece.square] = None
+            captured_piece.square = None
+            self.game.mark_dirty(captured_piece.rect)
+            captured_piece.kill()
+            self.game.captured_sprites.add(captured_piece)
+            captured_piece.change_transform(int(TILESIZE / 2))
+            if captured_piece.color == 'Black':
+                print('Black', captured_piece.piece_type, 'captured!')
+                captured_piece.pixel_location = white_captures.next_box_position
+                white_captures.set_next_box_position()
+            elif captured_piece.color == 'White':
+                print('White', captured_piece.piece_type, 'captured!')
+                captured_piece.pixel_location = black_captures.next_box_position
+                black_captures.set_next_box_position()
+
+    def restore_capture(self, captured_piece, sq):
+        """
+        Brings a captured piece back out of its team's captured box and onto the board.
+        :param captured_piece: piece being restored
+        :param sq: square it was captured on
+        :return:
+        """
+        black_captures = self.game.ui[2]
+        white_captures = self.game.ui[3]
+        self.game.captured_sprites.remove(captured_piece)
+        self.game.all_sprites.add(captured_piece)
+        captured_piece.change_transform(TILESIZE)
+        self.place_piece(captured_piece, sq)
+        if captured_piece.color == 'Black':
+            white_captures.set_previous_box_position()
+        else:
+            black_captures.set_previous_box_position()
 
     def evaluate_check(self, king):
         """
-        Evaluates if king is currently in check. Sets the check flag when needed.
+        Evaluates if king is currently in check by looking its square up in the attack map.
         :param king: king piece being evaluated
         :return: True if a check is in effect
         """
         if king.color == 'Black':
-            if king.cell_location in self.white_attacking:
-                return True
+            return self.white_attacking >> king.square & 1 == 1
         elif king.color == 'White':
-            if king.cell_location in self.black_attacking:
-                return True
+            return self.black_attacking >> king.square & 1 == 1
         return False
 
     def mate_check(self):
         """
-        Evaluates if check mate exists and sets winner.
+        Evaluates if check mate exists and sets winner. The side to move has lost if it has no legal move (which
+        the rules core answers without generating every move) and is in check, and the game is a draw if it has
+        no legal move otherwise or the rules core finds a draw by the fifty-move rule, repetition or material.
         :return:
         """
-        if not self.verified_black_moves:
-            self.winner = 'White'
-        if not self.verified_white_moves:
-            self.winner = 'Black'
+        self.winner = None
+        self.draw_reason = None
+        if not self.board.has_legal_move():
+            king = self.white_king if self.turn == 'White' else self.black_king
+            if self.evaluate_check(king):
+                self.winner = opponent(self.turn)
+                return
+            self.draw_reason = 'Stalemate'
+        else:
+            self.draw_reason = self.board.draw_reason()
+        if self.draw_reason:
+            self.winner = 'Draw'
@@ -0,0 +1,508 @@
+"""
+Computer opponent. Searches the rules core in board.py directly with negamax alpha-beta and iterative
+deepening, so it never touches sprites and its strength comes down to how many positions a second the core
+can make, unmake and generate moves for. BackgroundSearch runs it in a separate process so a caller such as
+the pygame loop is never blocked while it thinks. Runs headless, e.g.
+
+    python engine.py 4
+    python engine.py 20 --time 2
+    python engine.py 3 --fen "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"
+"""
+import argparse
+import multiprocessing
+import signal
+import sys
+import threading
+import time
+
+from board import *
+from book import open_book
+from tablebase import DRAW, ILLEGAL, Tablebases
+from tt import DEFAULT_MEGABYTES, EXACT, LOWER, UPPER, TranspositionTable
+
+MATE = 100000  # score for mating, less the plies it takes
+MATED_BELOW = 1000 - MATE  # scores past this either way are mate scores
+CHECK_EVERY = 1024  # nodes between checks of the clock and the stop flag
+VALUES = {PAWN: 100, KNIGHT: 320, BISHOP: 330, ROOK: 500, QUEEN: 900, KING: 0}
+
+# piece-square bonuses from White's side, laid out like the board with a8 first
+PIECE_SQUARES = {
+    PAWN: (0, 0, 0, 0, 0, 0, 0, 0,
+           50, 50, 50, 50, 50, 50, 50, 50,
+           10, 10, 20, 30, 30, 20, 10, 10,
+           5, 5, 10, 25, 25, 10, 5, 5,
+           0, 0, 0, 20, 20, 0, 0, 0,
+           5, -5, -10, 0, 0, -10, -5, 5,
+           5, 10, 10, -20, -20, 10, 10, 5,
+           0, 0, 0, 0, 0, 0, 0, 0),
+    KNIGHT: (-50, -40, -30, -30, -30, -30, -40, -50,
+             -40, -20, 0, 0, 0, 0, -20, -40,
+             -30, 0, 10, 15, 15, 10, 0, -30,
+             -30, 5, 15, 20, 20, 15, 5, -30,
+             -30, 0, 15, 20, 20, 15, 0, -30,
+             -30, 5, 10, 15, 15, 10, 5, -30,
+             -40, -20, 0, 5, 5, 0, -20, -40,
+             -50, -40, -30, -30, -30, -30, -40, -50),
+    BISHOP: (-20, -10, -10, -10, -10, -10, -10, -20,
+             -10, 0, 0, 0, 0, 0, 0, -10,
+             -10, 0, 5, 10, 10, 5, 0, -10,
+             -10, 5, 5, 10, 10, 5, 5, -10,
+             -10, 0, 10, 10, 10, 10, 0, -10,
+             -10, 10, 10, 10, 10, 10, 10, -10,
+             -10, 5, 0, 0, 0, 0, 5, -10,
+             -20, -10, -10, -10, -10, -10, -10, -20),
+    ROOK: (0, 0, 0, 0, 0, 0, 0, 0,
+           5, 10, 10, 10, 10, 10, 10, 5,
+           -5, 0, 0, 0, 0, 0, 0, -5,
+           -5, 0, 0, 0, 0, 0, 0, -5,
+           -5, 0, 0, 0, 0, 0, 0, -5,
+           -5, 0, 0, 0, 0, 0, 0, -5,
+           -5, 0, 0, 0, 0, 0, 0, -5,
+           0, 0, 0, 5, 5, 0, 0, 0),
+    QUEEN: (-20, -10, -10, -5, -5, -10, -10, -20,
+            -10, 0, 0, 0, 0, 0, 0, -10,
+            -10, 0, 5, 5, 5, 5, 0, -10,
+            -5, 0, 5, 5, 5, 5, 0, -5,
+            0, 0, 5, 5, 5, 5, 0, -5,
+            -10, 5, 5, 5, 5, 5, 0, -10,
+            -10, 0, 5, 0, 0, 0, 0, -10,
+            -20, -10, -10, -5, -5, -10, -10, -20),
+    KING: (-30, -40, -40, -50, -50, -40, -40, -30,
+           -30, -40, -40, -50, -50, -40, -40, -30,
+           -30, -40, -40, -50, -50, -40, -40, -30,
+           -30, -40, -40, -50, -50, -40, -40, -30,
+           -20, -30, -30, -40, -40, -30, -30, -20,
+           -10, -20, -20, -20, -20, -20, -20, -10,
+           20, 20, 0, 0, 0, 0, 20, 20,
+           20, 30, 10, 0, 0, 10, 30, 20),
+}
+
+# value of each piece on each square, positive for White and negative for Black
+SQUARE_VALUES = {}
+for color, piece_type in PIECES:
+    sign, flip = (1, 0) if color == WHITE else (-1, 56)
+    SQUARE_VALUES[(color, piece_type)] = [sign * (VALUES[piece_type] + PIECE_SQUARES[piece_type][sq ^ flip])
+                                          for sq in range(64)]
+
+
+def evaluate(board):
+    """
+    Static score of a position: material plus piece-square bonuses.
+    :param board: Board
+    :return: int, in centipawns from the side to move's point of view
+    """
+    score = 0
+    for piece, bb in board.bitboards.items():
+        values = SQUARE_VALUES[piece]
+        while bb:
+            low = bb & -bb
+            score += values[low.bit_length() - 1]
+            bb ^= low
+    return score if board.turn == WHITE else -score
+
+
+def score_to_table(score, ply):
+    """
+    Mate scores count plies from the root, but a stored result can be reached again at a different ply, so
+    they are stored counting from the position itself.
+    :param score: int
+    :param ply: plies from the root
+    :return: int
+    """
+    if score > -MATED_BELOW:
+        return score + ply
+    if score < MATED_BELOW:
+        return score - ply
+    return score
+
+
+def score_from_table(score, ply):
+    """
+    Reverses score_to_table.
+    :param score: int
+    :param ply: plies from the root
+    :return: int
+    """
+    if score > -MATED_BELOW:
+        return score - ply
+    if score < MATED_BELOW:
+        return score + ply
+    return score
+
+
+def tablebase_score(value, ply):
+    """
+    Search score for a tablebase value.
+    :param value: stored tablebase value, not ILLEGAL
+    :param ply: plies from the root
+    :return: int
+    """
+    if value == DRAW:
+        return 0
+    plies = value - 1
+    return MATE - ply - plies if plies % 2 else -MATE + ply + plies
+
+
+class SearchStopped(Exception):
+    """
+    Raised inside the search when its time runs out or it is cancelled.
+    """
+
+
+class Engine:
+    """
+    Negamax alpha-beta search with iterative deepening, a transposition table, a capture-only quiescence search
+    at the leaves, and move ordering by the stored or previous iteration's best move, captures (most valuable
+    victim first) and killer moves. Positions in the opening book are played from the book and positions in the
+    endgame tablebases from the tables, without searching, and tablebase positions reached in the search are
+    scored exactly.
+    """
+
+    def __init__(self, depth=3, tt=None, book=None, tablebases=None):
+        """
+        :param depth: plies to search to
+        :param tt: TranspositionTable, a new one of the default size if not given
+        :param book: OpeningBook, or None
+        :param tablebases: Tablebases, or None
+        """
+        self.depth = depth
+        self.tt = tt if tt is not None else TranspositionTable()
+        self.book = book
+        self.tablebases = tablebases
+        self.nodes = 0
+        self.killers = []  # up to 2 quiet moves per ply that caused a cutoff
+        self.deadline = None
+        self.stop = None
+        self.root_best = None  # best move and score found so far in the current iteration
+        # how the last move was found: 'book', 'tablebase' or 'search', with the depth completed and time taken
+        self.source = None
+        self.completed = 0
+        self.elapsed = 0.0
+
+    def search(self, board, depth=None, time_limit=None, stop=None):
+        """
+        Finds the best move for the side to move. The board passed in isn't changed; the search runs on a copy.
+        Each iteration goes one ply deeper until depth is reached or the time runs out, in which case the best
+        move found so far is returned.
+        :param board: Board
+        :param depth: plies to search to, self.depth by default
+        :param time_limit: seconds to search for, or None for no limit
+        :param stop: function returning True once the search should give up, or None
+        :return: (move, score), move being None if there are no legal moves. How the move was found is left in
+            source, completed, nodes and elapsed.
+        """
+        self.nodes = self.completed = 0
+        self.elapsed = 0.0
+        if self.book is not None:
+            move = self.book.pick(board)
+            if move is not None:
+                self.source = 'book'
+                return move, 0
+        if self.tablebases is not None:
+            value = self.tablebases.probe_value(board)
+            move = self.tablebases.best_move(board) if value not in (None, ILLEGAL) else None
+            if move is not None:
+                self.source = 'tablebase'
+                return move, tablebase_score(value, 0)
+        self.source = 'search'
+        self.tt.new_search()
+        depth = depth or self.depth
+        board = board.copy()
+        self.killers = [[] for _ in range(depth + 1)]
+        start = time.perf_counter()
+        self.deadline = start + time_limit if time_limit else None
+        self.stop = stop
+        moves = board.legal_moves()
+        best_move, best_score = (moves[0] if moves else None), 0
+        for iteration in range(1, depth + 1):
+            self.root_best = None
+            try:
+                best_move, best_score = self.root(board, iteration, best_move)
+            except SearchStopped:
+                # the previous best is searched first, so anything better found before stopping can be trusted
+                if self.root_best is not None:
+                    best_move, best_score = self.root_best
+                break
+            self.completed = iteration
+            if best_move is None or abs(best_score) >= MATE - iteration:
+                break
+        self.elapsed = time.perf_counter() - start
+        return best_move, best_score
+
+    def check_time(self):
+        """
+        Stops the search if its time is up or it has been cancelled.
+        :return:
+        """
+        if self.deadline is not None and time.perf_counter() >= self.deadline or self.stop and self.stop():
+            raise SearchStopped()
+
+    def root(self, board, depth, first=None):
+        """
+        One iteration of the search at the root.
+        :param board: Board
+        :param depth: int
+        :param first: move to search first, the best from the previous iteration
+        :return: (move, score)
+        """
+        best_move, alpha = None, -MATE - 1
+        for move in self.order(board, board.legal_moves(), 0, first):
+            board.make_move(move)
+            score = -self.negamax(board, depth - 1, -MATE - 1, -alpha, 1)
+            board.unmake_move()
+            if score > alpha:
+                best_move, alpha = move, score
+                self.root_best = best_move, alpha
+        return best_move, alpha
+
+    def negamax(self, board, depth, alpha, beta, ply):
+        """
+        Score of a position searched depth plies deep, from the side to move's point of view. Scores at or
+        below alpha or at or above beta are bounds rather than exact.
+        :param board: Board
+        :param depth: int
+        :param alpha: score the side to move is already assured of
+        :param beta: score the opponent is already assured of
+        :param ply: plies from the root
+        :return: int
+        """
+        if depth <= 0:
+            return self.quiesce(board, alpha, beta)
+        self.nodes += 1
+        if self.nodes % CHECK_EVERY == 0:
+            self.check_time()
+        if board.halfmove_clock >= 100 or board.repetitions.get(board.hash, 0) > 1:
+            return 0
+        if self.tablebases is not None and \
+                count(board.occupancy[WHITE] | board.occupancy[BLACK]) <= self.tablebases.max_pieces:
+            value = self.tablebases.probe_value(board)
+            if value is not None and value != ILLEGAL:
+                return tablebase_score(value, ply)
+        key = board.hash
+        entry = self.tt.probe(key)
+        tt_move = None
+        if entry is not None:
+            entry_depth, bound, score, tt_move = entry
+            if entry_depth >= depth:
+                score = score_from_table(score, ply)
+                if bound == EXACT or bound == LOWER and score >= beta or bound == UPPER and score <= alpha:
+                    return score
+        moves = board.legal_moves()
+        if not moves:
+            return -MATE + ply if board.in_check() else 0
+        original_alpha = alpha
+        best_move, best_score = None, -MATE - 1
+        for move in self.order(board, moves, ply, tt_move):
+            board.make_move(move)
+            score = -self.negamax(board, depth - 1, -beta, -alpha, ply + 1)
+            board.unmake_move()
+            if score > best_score:
+                best_move, best_score = move, score
+            if score >= beta:
+                if board.squares[move[1]] is None and not move[2]:
+                    killers = self.killers[ply]
+                    if move not in killers:
+                        killers.insert(0, move)
+                        del killers[2:]
+                break
+            if score > alpha:
+                alpha = score
+        if best_score >= beta:
+            bound = LOWER
+        elif best_score > original_alpha:
+            bound = EXACT
+        else:
+            bound = UPPER
+        self.tt.store(key, min(depth, 255), bound, score_to_table(best_score, ply), best_move)
+        return best_score
+
+    def quiesce(self, board, alpha, beta):
+        """
+        Plays out captures and promotions until the position is quiet, so a leaf isn't scored in the middle
+        of an exchange.
+        :param board: Board
+        :param alpha: int
+        :param beta: int
+        :return: int
+        """
+        self.nodes += 1
+        if self.nodes % CHECK_EVERY == 0:
+            self.check_time()
+        stand_pat = evaluate(board)
+        if stand_pat >= beta:
+            return stand_pat
+        if stand_pat > alpha:
+            alpha = stand_pat
+        squares = board.squares
+        passant = board.passant
+        captures = [move for move in board.legal_moves()
+                    if squares[move[1]] is not None or move[2] or move[1] == passant]
+        for move in self.order(board, captures, None):
+            board.make_move(move)
+            score = -self.quiesce(board, -beta, -alpha)
+            board.unmake_move()
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def order(self, board, moves, ply, first=None):
+        """
+        Sorts moves so the ones most likely to cause a cutoff are searched first.
+        :param board: Board
+        :param moves: list of moves
+        :param ply: plies from the root, for the killer moves, or None in the quiescence search
+        :param first: move to put ahead of all others
+        :return: list of moves
+        """
+        squares = board.squares
+        killers = self.killers[ply] if ply is not None and ply < len(self.killers) else ()
+
+        def priority(move):
+            if move == first:
+                return 100000
+            victim = squares[move[1]]
+            if victim is not None:
+                return 10000 + 10 * VALUES[victim[1]] - VALUES[squares[move[0]][1]] // 10
+            if move[2]:
+                return 9000 + VALUES[move[2]]
+            if move in killers:
+                return 8000 - killers.index(move)
+            return 0
+
+        return sorted(moves, key=priority, reverse=True)
+
+
+def _serve(requests, results, current, megabytes, book_path, tablebase_path):
+    """
+    Worker process loop: searches each requested position and sends back the move. A search gives up as soon
+    as current no longer holds its request number.
+    :param requests: queue of (number, board, depth, time_limit), None to shut down
+    :param results: queue of (number, move, score)
+    :param current: shared number of the request the caller still wants an answer to
+    :param megabytes: transposition table size
+    :param book_path: opening book file, used if it exists
+    :param tablebase_path: directory of endgame tablebases, or None
+    :return:
+    """
+    # a worker forked from the game inherits SDL's SIGTERM handler, which would make it ignore terminate()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    tablebases = Tablebases(tablebase_path) if tablebase_path else None
+    engine = Engine(tt=TranspositionTable(megabytes), book=open_book(book_path), tablebases=tablebases)
+    while True:
+        request = requests.get()
+        if request is None:
+            return
+        number, board, depth, time_limit = request
+        if current.value != number:
+            continue
+        move, score = engine.search(board, depth, time_limit, lambda: current.value != number)
+        results.put((number, move, score))
+
+
+class BackgroundSearch:
+    """
+    Runs the engine in a worker process, so searching never blocks the caller. Results are handed to a
+    callback from a listener thread, and only for the latest request: starting a new search or cancelling
+    makes any search still running give up and its result be dropped.
+    """
+
+    def __init__(self, callback, megabytes=None, book_path=None, tablebase_path=None):
+        """
+        Starts the worker process and the listener thread.
+        :param callback: called as callback(number, move, score) when a search finishes
+        :param megabytes: transposition table size, tt.py's default if not given
+        :param book_path: opening book file, or None to always search
+        :param tablebase_path: directory of endgame tablebases, or None
+        """
+        self.callback = callback
+        self.requests = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.current = multiprocessing.Value('i', 0)
+        args = (self.requests, self.results, self.current, megabytes or DEFAULT_MEGABYTES, book_path,
+                tablebase_path)
+        self.process = multiprocessing.Process(target=_serve, args=args, daemon=True)
+        self.process.start()
+        self.listener = threading.Thread(target=self.listen, daemon=True)
+        self.listener.start()
+
+    def start(self, board, depth, time_limit):
+        """
+        Starts searching a position, cancelling any search already running.
+        :param board: Board
+        :param depth: most plies to search
+        :param time_limit: seconds to search for
+        :return: request number the result will come back with
+        """
+        with self.current.get_lock():
+            self.current.value += 1
+            number = self.current.value
+        self.requests.put((number, board.copy(), depth, time_limit))
+        return number
+
+    def cancel(self):
+        """
+        Stops the running search, if any, and drops its result.
+        :return:
+        """
+        with self.current.get_lock():
+            self.current.value += 1
+
+    def listen(self):
+        """
+        Listener thread loop: passes results for the latest request on to the callback.
+        :return:
+        """
+        while True:
+            result = self.results.get()
+            if result is None:
+                return
+            number, move, score = result
+            if number == self.current.value:
+                self.callback(number, move, score)
+
+    def close(self):
+        """
+        Cancels any search and shuts the worker process and listener thread down.
+        :return:
+        """
+        self.cancel()
+        self.requests.put(None)
+        self.results.put(None)
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Search a position with the engine.')
+    parser.add_argument('depth', type=int, help='plies to search')
+    parser.add_argument('--fen', default=START_FEN, help='position to search (default: starting position)')
+    parser.add_argument('--time', type=float, default=None, help='seconds to search for (default: no limit)')
+    parser.add_argument('--hash', type=float, default=DEFAULT_MEGABYTES, help='transposition table size in MB')
+    parser.add_argument('--book', default=None, help='opening book to play from before searching')
+    parser.add_argument('--tablebases', default=None, help='directory of endgame tablebases')
+    args = parser.parse_args(argv)
+
+    board = Board()
+    board.set_fen(args.fen)
+    tablebases = Tablebases(args.tablebases) if args.tablebases else None
+    engine = Engine(args.depth, TranspositionTable(args.hash), open_book(args.book), tablebases)
+    move, score = engine.search(board, time_limit=args.time)
+    if engine.source == 'search':
+        rate = engine.nodes / engine.elapsed if engine.elapsed else 0.0
+        print('depth {} nodes {} {:.2f}s {:,.0f} nodes/s'.format(engine.completed, engine.nodes, engine.elapsed,
+                                                                 rate))
+    else:
+        print(engine.source, 'move')
+    print(move_name(move) if move else 'no legal moves', score)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,4 +1,10 @@
+import sys
+
 from data import *
+from book import open_book
+from engine import BackgroundSearch
+from pgn import move_san
+from tablebase import Tablebases, describe
 from ui import *
 
 
@@ -7,9 +13,10 @@ class Game:
     Instance of PyGame.
     """
 
-    def __init__(self):
+    def __init__(self, fen=START_FEN):
         """
         Init
+        :param fen: position every new game starts from
         """
         pg.init()
         pg.mixer.init()
@@ -18,63 +25,97 @@ class Game:
         self.font = pg.font.Font(FONT_NAME, FONT_SIZE)
         self.clock = pg.time.Clock()
         self.running = True
+        self.fen = fen
+        self.engine = BackgroundSearch(self.post_engine_move, TT_MEGABYTES, BOOK_PATH, TABLEBASE_PATH)
+        self.book = open_book(BOOK_PATH)
+        self.show_book_hint = False
+        self.book_hint = ''  # book moves for the current position, shown when show_book_hint is on
+        self.tablebases = Tablebases(TABLEBASE_PATH)
+        self.tablebase_readout = ''  # tablebase result for the current position, if it has one
+        self.search = None  # number of the engine search being waited on
+        self.search_hash = None  # hash of the position it is searching
+        self.redraw_all = True  # whole window needs repainting
+        self.dirty_rects = []  # parts of the window that need repainting
+        self.layout = None  # board geometry the cached surfaces below were built for
+        self.board_surface = None  # pre-rendered empty board
+        self.overlays = {}  # translucent highlight surfaces, by (size, color)
+        self.rendered_text = {}  # last text drawn in each text slot and its surface
 
     def new(self):
         """
         New Game
         :return:
         """
+        self.cancel_search()
         self.data = GameData(self)
         self.all_sprites = pg.sprite.LayeredUpdates()
         self.captured_sprites = pg.sprite.LayeredUpdates()
         self.ui = [] # list of all UI elements (like rects)
         self.create_ui()
-        self.data.populate_board()
-        self.data.scan_board()
-        self.data.update_move_banks()
+        self.data.populate_board(self.fen)
         for sprite in self.all_sprites:
             sprite.set_previous_location()
-            sprite.simulate_move_bank()
+        self.data.mate_check()
+        self.update_book_hint()
+        self.update_tablebase_readout()
+        self.redraw_all = True
         self.run()
 
     def run(self):
         """
-        Game Loop
+        Game Loop. Runs frames at FPS while a piece is being dragged or the position has just changed, and
+        otherwise sleeps until an event arrives (a click, a key or the engine's move), so an idle window
+        uses no CPU.
         :return:
         """
         self.playing = True
         while self.playing:
-            self.clock.tick(FPS)
-            self.events()
-            self.update()
+            if self.data.selected_piece or self.redraw_all or self.dirty_rects:
+                self.clock.tick(FPS)
+                self.events()
+            else:
+                self.events([pg.event.wait(IDLE_TIMEOUT)] + pg.event.get())
+            self.engine_turn()
+            if self.data.selected_piece or self.redraw_all:
+                self.update()
             self.draw()
 
-    def events(self):
+    def events(self, events=None):
         """
         Game Loop - Events
+        :param events: events to handle, by default the ones waiting in the queue
         :return:
         """
-        for event in pg.event.get():
+        if events is None:
+            events = pg.event.get()
+        for event in events:
 
             # check for clicking of mouse
             if event.type == pg.MOUSEBUTTONDOWN and event.button == 1:
-                clicked_something = self.clicked_on()
-                if clicked_something == 'Piece':
-                    piece = self.data.get_piece()
+                clicked_something, element = self.clicked_on()
+                # pieces stay put while the engine thinks, or its move could land under a dragged piece
+                if clicked_something == 'Piece' and self.search is None:
+                    piece = element
                     self.data.selected_piece = piece
-                    if self.data.turn_order is True:
-                        if piece.color == self.data.turn:
-                            piece.set_previous_location()
-                        else:
-                            piece.verified_move_bank.clear()
-                    elif self.data.turn_order is False:
-                        piece.set_previous_location()
+                    piece.set_previous_location()
+                    if self.data.turn_order is True and piece.color != self.data.turn:
+                        piece.verified_move_bank.clear()
+                    else:
+                        self.data.update_verified_moves(piece)
                 elif clicked_something == 'Rect':
-                    rect = self.data.get_rect()
+                    self.redraw_all = True
+                    rect = element
                     if rect.text == 'Turn Order On':
                         self.data.turn_order = True
                     elif rect.text == 'Turn Order Off':
                         self.data.turn_order = False
+                    elif rect.text in ('Engine White', 'Engine Black'):
+                        color = rect.text.split()[1]
+                        if color in self.data.engine_colors:
+                            self.data.engine_colors.discard(color)
+                        else:
+                            self.data.engine_colors.add(color)
+                        self.cancel_search()
 
 
             # Most game logic happens under this piece. Game state updates upon dropping piece on location.
@@ -83,30 +124,37 @@ class Game:
                 if piece:
                     self.data.selected_piece = piece
                     nearest_cell = self.data.cell_pos(piece.pixel_location)
-                    if piece.move_validation(nearest_cell):
-                        self.data.scan_board()
-                        self.data.update_move_banks()
-                        self.data.change_turn()
-                if self.data.evaluate_check(self.data.black_king):
-                    self.data.black_king.check_flag = True
-                else:
-                    self.data.black_king.check_flag = False
-                if self.data.evaluate_check(self.data.white_king):
-                    self.data.white_king.check_flag = True
-                else:
-                    self.data.white_king.check_flag = False
-
+                    piece.move_validation(nearest_cell)
                 self.data.selected_piece = None
-                self.data.highlighted_cells.clear()
-                self.data.clear_team_move_banks()
-                for sprite in self.all_sprites:
-                    sprite.set_previous_location()
-                    sprite.simulate_move_bank()
-                if not self.data.black_king.has_moved:
-                    self.data.black_king.castle_check(4, 0)
-                if not self.data.white_king.has_moved:
-                    self.data.white_king.castle_check(4, 7)
-                self.data.mate_check()
+                self.update_game_state()
+
+            # Backspace takes back the last move, and the engine's reply to it when playing against the engine
+            if event.type == pg.KEYDOWN and event.key == pg.K_BACKSPACE:
+                if not self.data.selected_piece and self.data.unmake_move():
+                    while len(self.data.engine_colors) == 1 and self.data.turn in self.data.engine_colors:
+                        if not self.data.unmake_move():
+                            break
+                    self.update_game_state()
+
+            # F prints the current position as FEN
+            if event.type == pg.KEYDOWN and event.key == pg.K_f:
+                print(self.data.fen())
+
+            # H shows or hides the opening book moves for the current position
+            if event.type == pg.KEYDOWN and event.key == pg.K_h:
+                self.show_book_hint = not self.show_book_hint
+                self.redraw_all = True
+
+            # the window was uncovered, so what was drawn is gone
+            if event.type == pg.VIDEOEXPOSE:
+                self.redraw_all = True
+
+            # the engine has picked a move
+            if event.type == ENGINE_MOVE and event.number == self.search:
+                self.search = None
+                if event.move:
+                    self.data.make_move(event.move)
+                    self.update_game_state()
 
             # Functionality to drag and drop chess pieces
             click = pg.mouse.get_pressed(3)
@@ -116,7 +164,11 @@ class Game:
                     pg.mouse.set_visible(False)
                     self.all_sprites.move_to_front(piece)
                     piece.pixel_location = pg.mouse.get_pos()
-                    self.data.highlighted_cells = piece.verified_move_bank.copy()
+                    cells = piece.verified_move_bank.copy()
+                    if cells != self.data.highlighted_cells:
+                        for cell in self.data.highlighted_cells + cells:
+                            self.mark_dirty(self.cell_rect(cell))
+                        self.data.highlighted_cells = cells
 
             elif not click[0]:
                 pg.mouse.set_visible(True)
@@ -129,7 +181,8 @@ class Game:
 
     def update(self):
         """
-        Game Loop - Update
+        Game Loop - Update. Sprites only move while dragged or when the position changes, so this is skipped
+        the rest of the time.
         :return:
         """
         self.all_sprites.update()
@@ -137,30 +190,158 @@ class Game:
 
     def draw(self):
         """
-        Game Loop - Draw
+        Game Loop - Draw. Only the part of the window that changed since the last frame, the area covering every
+        dirty rect, is repainted and sent to the display, so nothing is drawn at all while nothing changes. The
+        scene is drawn once whatever the number of rects. The whole window is repainted when it is uncovered, a
+        button is toggled or a new game starts.
+        :return:
+        """
+        if self.redraw_all:
+            self.draw_scene()
+            # always do last after drawing everything
+            pg.display.flip()
+        elif self.dirty_rects:
+            area = self.dirty_rects[0].unionall(self.dirty_rects[1:])
+            self.screen.set_clip(area)
+            self.draw_scene()
+            self.screen.set_clip(None)
+            pg.display.update(area)
+        self.redraw_all = False
+        self.dirty_rects = []
+
+    def draw_scene(self):
+        """
+        Draws everything, limited to the screen's clip area if one is set.
         :return:
         """
         self.screen.fill(WHITE)
         self.draw_board()
         self.draw_ui()
 
-        # always do last after drawing everything
-        pg.display.flip()
+    def mark_dirty(self, rect):
+        """
+        Queues part of the window to be repainted in the next frame.
+        :param rect: pg.Rect
+        :return:
+        """
+        self.dirty_rects.append(rect.copy())
+
+    @staticmethod
+    def cell_rect(cell):
+        """
+        Screen area of a board cell.
+        :param cell: tuple
+        :return: pg.Rect
+        """
+        x, y = cell
+        return pg.Rect(x * TILESIZE + X_OFFSET, y * TILESIZE + Y_OFFSET, TILESIZE, TILESIZE)
+
+    @staticmethod
+    def text_rect():
+        """
+        Screen area of the text lines below the board: winner, book hint and tablebase readout.
+        :return: pg.Rect
+        """
+        top = BOARDHEIGHT + Y_OFFSET + TILESIZE*(5/3)
+        return pg.Rect(X_OFFSET, top, WIDTH - X_OFFSET, 2 * (FONT_SIZE + 4))
+
+    def update_game_state(self):
+        """
+        Refreshes check flags, legal moves and the winner after the position changes or a piece is dropped.
+        Only what changed is marked for repainting: the cells and captured box slots the sprites moved between
+        (making and taking back moves marks those), the highlights and the text lines if their text changed.
+        :return:
+        """
+        text = (self.data.winner, self.data.draw_reason, self.book_hint, self.tablebase_readout)
+        if self.data.evaluate_check(self.data.black_king):
+            self.data.black_king.check_flag = True
+        else:
+            self.data.black_king.check_flag = False
+        if self.data.evaluate_check(self.data.white_king):
+            self.data.white_king.check_flag = True
+        else:
+            self.data.white_king.check_flag = False
+
+        for cell in self.data.highlighted_cells:
+            self.mark_dirty(self.cell_rect(cell))
+        self.data.highlighted_cells.clear()
+        self.data.mate_check()
+        self.update_book_hint()
+        self.update_tablebase_readout()
+        if text != (self.data.winner, self.data.draw_reason, self.book_hint, self.tablebase_readout):
+            self.mark_dirty(self.text_rect())
+        # sprites moved by the move, or a rejected drop sent back, are drawn where they now are
+        self.update()
+        if self.data.board.hash != self.search_hash:
+            self.cancel_search()
+
+    def update_book_hint(self):
+        """
+        Looks the current position up in the opening book, if there is one.
+        :return:
+        """
+        if self.book is None:
+            self.book_hint = 'Book: none loaded'
+            return
+        moves = self.book.moves(self.data.board)
+        self.book_hint = 'Book: ' + (' '.join(move_san(self.data.board, move) for move, weight in moves[:4])
+                                     if moves else 'out of book')
+
+    def update_tablebase_readout(self):
+        """
+        Looks the current position up in the endgame tablebases.
+        :return:
+        """
+        board = self.data.board
+        result = self.tablebases.probe(board)
+        self.tablebase_readout = 'Tablebase: ' + describe(board, result) if result else ''
+
+    def engine_turn(self):
+        """
+        Starts the engine thinking in the background if it is playing the side to move and the game isn't over.
+        Its move arrives later as an ENGINE_MOVE event, so the game loop keeps running meanwhile.
+        :return:
+        """
+        if self.search is not None or self.data.winner or self.data.selected_piece or \
+                self.data.turn not in self.data.engine_colors:
+            return
+        self.search = self.engine.start(self.data.board, ENGINE_DEPTH, ENGINE_TIME)
+        self.search_hash = self.data.board.hash
+
+    def post_engine_move(self, number, move, score):
+        """
+        Called from the engine's listener thread when a search finishes. Hands the move to the game loop as an
+        event.
+        :param number: search number
+        :param move: best move, or None
+        :param score: int
+        :return:
+        """
+        pg.event.post(pg.event.Event(ENGINE_MOVE, number=number, move=move, score=score))
+
+    def cancel_search(self):
+        """
+        Stops the engine thinking and ignores its move, used whenever the position changes under it.
+        :return:
+        """
+        if self.search is not None:
+            self.engine.cancel()
+            self.search = None
 
     def clicked_on(self):
         """
-        Determines if the mouse clicked on any element (sprite, rect, etc) on the screen.
-        :return: Type of element clicked on, False if nothing
+        Determines if the mouse clicked on any element (sprite, rect, etc) on the screen. The click is looked up
+        once, by cell for pieces and through ui_index for everything else.
+        :return: (Type of element clicked on, the element), (False, None) if nothing
         """
         pos = pg.mouse.get_pos()
-        clicked_sprites = [sprite for sprite in self.all_sprites if sprite.rect.collidepoint(pos)]
-        clicked_rects = [element for element in self.ui if element.box.collidepoint(pos)]
-        if clicked_sprites:
-            return 'Piece'
-        elif clicked_rects:
-            return 'Rect'
-        else:
-            return False
+        piece = self.data.get_piece(pos)
+        if piece:
+            return 'Piece', piece
+        rect = self.data.get_rect(pos)
+        if rect:
+            return 'Rect', rect
+        return False, None
 
     def create_ui(self):
         """
@@ -169,6 +350,21 @@ class Game:
         """
         self.create_turn_buttons()
         self.create_captured_boxes()
+        self.create_engine_buttons()
+        self.index_ui()
+
+    def index_ui(self):
+        """
+        Files every UI element under each TILESIZE square of the screen its box overlaps, so a click only has
+        to be tested against the few elements in its own square.
+        :return:
+        """
+        self.ui_index = {}
+        for element in self.ui:
+            box = element.box
+            for x in range(int(box.x // TILESIZE), int((box.x + box.w - 1) // TILESIZE) + 1):
+                for y in range(int(box.y // TILESIZE), int((box.y + box.h - 1) // TILESIZE) + 1):
+                    self.ui_index.setdefault((x, y), []).append(element)
 
     def create_turn_buttons(self):
         """
@@ -205,6 +401,23 @@ class Game:
         white_captures = CapturedBox((x, y2), (length, width), 'Black', self)
         self.ui.append(white_captures)
 
+    def create_engine_buttons(self):
+        """
+        Creates buttons that hand a color over to the engine, between the captured boxes.
+        :return:
+        """
+        x = BOARDWIDTH + X_OFFSET + TILESIZE
+        y = Y_OFFSET + TILESIZE * 3
+        y2 = y + TILESIZE * 3 / 2
+        length = TILESIZE*3 - TILESIZE/2
+        width = TILESIZE
+
+        engine_black = TextBox('Engine Black', (x, y), (length, width), self)
+        self.ui.append(engine_black)
+
+        engine_white = TextBox('Engine White', (x, y2), (length, width), self)
+        self.ui.append(engine_white)
+
     def draw_board(self):
         """
         Holds all the board related draws.
@@ -227,58 +440,122 @@ class Game:
     def draw_grid(self):
         """
         Draws Chess board. X_OFFSET and Y_OFFSET can be adjusted in settings.py to adjust where the board appears.
-        Lines drawn after tiles for better visuals.
         :return:
         """
-        # Fill Colors
-        for x_inter, x in enumerate(range(0 + X_OFFSET, BOARDWIDTH + X_OFFSET, TILESIZE)):
-            for y_inter, y in enumerate(range(0 + Y_OFFSET, BOARDHEIGHT + Y_OFFSET, TILESIZE)):
+        self.prepare_surfaces()
+        self.screen.blit(self.board_surface, (X_OFFSET, Y_OFFSET))
+
+    def prepare_surfaces(self):
+        """
+        Renders the empty board once and keeps it, along with the highlight overlays, until the tile size or
+        offsets change.
+        :return:
+        """
+        layout = (TILESIZE, BOARDWIDTH, BOARDHEIGHT, X_OFFSET, Y_OFFSET)
+        if layout == self.layout:
+            return
+        self.layout = layout
+        self.overlays = {}
+        board = pg.Surface((BOARDWIDTH + 1, BOARDHEIGHT + 1)).convert()
+        board.fill(WHITE)
+
+        # Fill Colors, lines drawn after tiles for better visuals
+        for x_inter, x in enumerate(range(0, BOARDWIDTH, TILESIZE)):
+            for y_inter, y in enumerate(range(0, BOARDHEIGHT, TILESIZE)):
                 if (x_inter + y_inter) % 2 == 1:
-                    pg.draw.rect(self.screen, GRAY, (x, y, TILESIZE, TILESIZE))
+                    pg.draw.rect(board, GRAY, (x, y, TILESIZE, TILESIZE))
 
         # Draw Lines
-        for x in range(0 + X_OFFSET, BOARDWIDTH+1 + X_OFFSET, TILESIZE):
-            pg.draw.line(self.screen, BLACK, (x, 0 + Y_OFFSET), (x, BOARDHEIGHT + Y_OFFSET))
-        for y in range(0 + Y_OFFSET, BOARDHEIGHT+1 + Y_OFFSET, TILESIZE):
-            pg.draw.line(self.screen, BLACK, (0 + X_OFFSET, y), (BOARDWIDTH + X_OFFSET, y))
+        for x in range(0, BOARDWIDTH+1, TILESIZE):
+            pg.draw.line(board, BLACK, (x, 0), (x, BOARDHEIGHT))
+        for y in range(0, BOARDHEIGHT+1, TILESIZE):
+            pg.draw.line(board, BLACK, (0, y), (BOARDWIDTH, y))
+        self.board_surface = board
+
+    def overlay(self, size, color):
+        """
+        Half transparent surface used to highlight an area, built the first time it is asked for.
+        :param size: (length, width)
+        :param color: tuple
+        :return: pg.Surface
+        """
+        key = (tuple(size), color)
+        surface = self.overlays.get(key)
+        if surface is None:
+            surface = pg.Surface(size).convert()
+            surface.set_alpha(128)
+            surface.fill(color)
+            self.overlays[key] = surface
+        return surface
 
     def draw_highlights(self):
         """
         Highlights cells when moving and also highlights turn order button.
         :return:
         """
+        self.prepare_surfaces()
+        highlight = self.overlay((TILESIZE-1, TILESIZE-1), YELLOW)
         for cell in self.data.highlighted_cells:
             g_pos = self.data.global_pos(cell)
             offset = TILESIZE / 2
             x, y = g_pos
             x -= offset
             y -= offset
-            highlight = pg.Surface((TILESIZE-1, TILESIZE-1))
-            highlight.set_alpha(128)
-            highlight.fill(YELLOW)
             self.screen.blit(highlight, (x+1, y+1))
 
         y = BOARDHEIGHT + Y_OFFSET + TILESIZE / 2
         length = 2 * TILESIZE + TILESIZE / 2
         width = TILESIZE
-        turn_order_highlight = pg.Surface((length, width))
-        turn_order_highlight.set_alpha(128)
-        turn_order_highlight.fill(GREEN)
+        turn_order_highlight = self.overlay((length, width), GREEN)
         x_pos = X_OFFSET
         if self.data.turn_order == False:
             x_pos += (3 * TILESIZE)
         self.screen.blit(turn_order_highlight, (x_pos, y))
 
+        for ui_element in self.ui:
+            if ui_element.text in ('Engine White', 'Engine Black') and \
+                    ui_element.text.split()[1] in self.data.engine_colors:
+                engine_highlight = self.overlay(ui_element.box.size, GREEN)
+                self.screen.blit(engine_highlight, ui_element.box.topleft)
+
     def draw_text(self):
         """
         Used for debugging at the moment.
         :return:
         """
-        text = self.font.render('Winner: ' + str(self.data.winner), True, BLACK)
+        winner = 'Winner: ' + str(self.data.winner)
+        if self.data.draw_reason:
+            winner += ' (' + self.data.draw_reason + ')'
+        text = self.render_text('winner', winner)
         text_rect = text.get_rect()
         text_rect.topleft = (X_OFFSET, BOARDHEIGHT + Y_OFFSET + TILESIZE*(5/3))
         self.screen.blit(text, text_rect)
 
+        if self.show_book_hint:
+            text = self.render_text('book hint', self.book_hint)
+            text_rect = text.get_rect()
+            text_rect.topleft = (X_OFFSET + TILESIZE*4, BOARDHEIGHT + Y_OFFSET + TILESIZE*(5/3))
+            self.screen.blit(text, text_rect)
+
+        if self.tablebase_readout:
+            text = self.render_text('tablebase', self.tablebase_readout)
+            text_rect = text.get_rect()
+            text_rect.topleft = (X_OFFSET, BOARDHEIGHT + Y_OFFSET + TILESIZE*(5/3) + FONT_SIZE + 4)
+            self.screen.blit(text, text_rect)
+
+    def render_text(self, slot, text):
+        """
+        Renders a line of text, keeping the surface until the text shown in that slot changes, so the font is
+        only used when the game state changes rather than every frame.
+        :param slot: name of the place the text is shown
+        :param text: str
+        :return: pg.Surface
+        """
+        cached = self.rendered_text.get(slot)
+        if cached is None or cached[0] != text:
+            cached = self.rendered_text[slot] = (text, self.font.render(text, True, BLACK))
+        return cached[1]
+
     def show_start_screen(self):
         """
         Game splash / start screen
@@ -295,12 +572,21 @@ class Game:
 
 
 def main():
-    g = Game()
+    fen = ' '.join(sys.argv[1:]) or START_FEN
+    try:
+        GameData.board_from_fen(fen)
+    except ValueError as error:
+        print(error)
+        sys.exit(1)
+    g = Game(fen)
     g.show_start_screen()
-    while g.running:
-        g.new()
-        g.show_go_screen()
-    pg.quit()
+    try:
+        while g.running:
+            g.new()
+            g.show_go_screen()
+    finally:
+        g.engine.close()
+        pg.quit()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,67 @@
+"""
+Bounded least-recently-used cache for work done per position, keyed by the position's Zobrist hash (along with
+anything else the work depends on).
+"""
+from collections import OrderedDict
+
+
+class MoveCache:
+    """
+    LRU cache with hit / miss counters. Once full, the entry used longest ago is dropped to make room.
+    """
+
+    def __init__(self, capacity):
+        """
+        :param capacity: most entries kept at once
+        """
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """
+        Returns the entry for key, marking it as most recently used, or None if it isn't cached.
+        :param key: position hash, or a tuple starting with it
+        :return:
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        """
+        Stores an entry, dropping the least recently used one if the cache is full.
+        :param key: position hash, or a tuple starting with it
+        :param entry: value to cache
+        :return:
+        """
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Empties the cache and resets the counters.
+        :return:
+        """
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        """
+        Fraction of lookups that were hits.
+        :return: float
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -0,0 +1,223 @@
+"""
+Perft: counts the leaf nodes of the legal move tree to a fixed depth. The counts for well known positions are
+published, so comparing against them checks the move generator, and timing the count tracks its speed.
+Runs headless, e.g.
+
+    python perft.py 5
+    python perft.py 3 --fen "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1" --divide
+    python perft.py 3 --suite
+    python perft.py --selftest 150
+
+The self test plays random games and checks the rules core's shortcuts against the slow way of doing the same
+thing at every position: legal moves from check and pin rays against making and unmaking every pseudo-legal
+move, the incrementally updated attack map against one built from scratch, the incrementally updated
+Zobrist key against compute_hash, and packed moves and positions against what they were packed from.
+"""
+import argparse
+import random
+import sys
+import time
+
+from attacks import AttackMap
+from bitboard import squares_of
+from board import Board, START_FEN, move_name, opponent, unpack_move
+
+# published node counts by depth (index 0 is depth 1)
+REFERENCE = {
+    START_FEN: [20, 400, 8902, 197281, 4865609, 119060324],
+    'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1': [48, 2039, 97862, 4085603, 193690690],
+    '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1': [14, 191, 2812, 43238, 674624, 11030083],
+    'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1': [6, 264, 9467, 422333, 15833292],
+    'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8': [44, 1486, 62379, 2103487, 89941194],
+    'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10': [46, 2079, 89890, 3894594],
+}
+
+
+def perft(board, depth):
+    """
+    Number of leaf nodes depth plies below the board's position. The last ply is counted from the length of
+    the move list rather than played out.
+    :param board: Board
+    :param depth: int
+    :return: int
+    """
+    moves = board.legal_moves()
+    if depth <= 1:
+        return len(moves) if depth == 1 else 1
+    nodes = 0
+    for move in moves:
+        board.make_move(move)
+        nodes += perft(board, depth - 1)
+        board.unmake_move()
+    return nodes
+
+
+def divide(board, depth):
+    """
+    Perft split by the first move, for tracking down which move a wrong count comes from.
+    :param board: Board
+    :param depth: int, at least 1
+    :return: list of (move, nodes)
+    """
+    results = []
+    for move in board.legal_moves():
+        board.make_move(move)
+        results.append((move, perft(board, depth - 1)))
+        board.unmake_move()
+    return results
+
+
+def reference_count(fen, depth):
+    """
+    Published perft count for a position, if known.
+    :param fen: str
+    :param depth: int
+    :return: int or None
+    """
+    counts = REFERENCE.get(fen)
+    if counts is None:
+        key = ' '.join(fen.split()[:4])
+        for known, known_counts in REFERENCE.items():
+            if ' '.join(known.split()[:4]) == key:
+                counts = known_counts
+    if counts and 0 < depth <= len(counts):
+        return counts[depth - 1]
+
+
+def run(fen, depth, show_divide=False):
+    """
+    Runs perft on one position and prints the count, speed and whether it matches the reference.
+    :param fen: str
+    :param depth: int
+    :param show_divide: print the per-move breakdown as well
+    :return: True if the count matches the reference or there is none
+    """
+    board = Board()
+    board.set_fen(fen)
+    start = time.perf_counter()
+    if show_divide:
+        results = divide(board, depth)
+        nodes = sum(count for _, count in results)
+    else:
+        results = []
+        nodes = perft(board, depth)
+    elapsed = time.perf_counter() - start
+
+    for move, count in sorted(results, key=lambda result: move_name(result[0])):
+        print(move_name(move) + ':', count)
+    rate = nodes / elapsed if elapsed else 0.0
+    print('{}  depth {}  nodes {}  {:.2f}s  {:,.0f} nodes/s'.format(fen, depth, nodes, elapsed, rate))
+
+    expected = reference_count(fen, depth)
+    if expected is None:
+        print('no reference count')
+        return True
+    if expected == nodes:
+        print('matches reference')
+        return True
+    print('MISMATCH: expected', expected)
+    return False
+
+
+def slow_legal_moves(board):
+    """
+    Legal moves found by playing out every pseudo-legal move and checking whether it leaves the king attacked.
+    :param board: Board
+    :return: list of moves
+    """
+    color = board.turn
+    legal = []
+    for sq in squares_of(board.occupancy[color]):
+        for move in board.pseudo_moves_from(sq):
+            board.make_move(move)
+            if not board.is_attacked(board.kings[color], opponent(color)):
+                legal.append(move)
+            board.unmake_move()
+    return legal
+
+
+def check_position(board):
+    """
+    Compares the rules core's fast paths with the slow ones for the board's position.
+    :param board: Board with an AttackMap attached
+    :return: list of problems found, empty if none
+    """
+    problems = []
+    if sorted(board.legal_moves(), key=move_name) != sorted(slow_legal_moves(board), key=move_name):
+        problems.append('legal moves differ from make/unmake filtering')
+    fresh = AttackMap(board)
+    if fresh.counts != board.attack_map.counts or fresh.attacked != board.attack_map.attacked:
+        problems.append('attack map differs from a fresh rebuild')
+    if board.hash != board.compute_hash():
+        problems.append('Zobrist key differs from compute_hash')
+    if list(map(unpack_move, board.packed_moves())) != board.legal_moves():
+        problems.append('packed moves differ from legal moves')
+    unpacked = Board()
+    unpacked.set_packed(board.pack())
+    if unpacked.fen() != board.fen() or unpacked.hash != board.hash:
+        problems.append('position does not survive pack / set_packed')
+    return problems
+
+
+def selftest(games, plies=200, seed=0):
+    """
+    Plays random games from the reference positions, checking every position with check_position, then takes
+    every move back and checks the starting position comes back exactly.
+    :param games: number of games
+    :param plies: longest game
+    :param seed: random seed, so a failure can be repeated
+    :return: number of problems found
+    """
+    rng = random.Random(seed)
+    fens = list(REFERENCE)
+    failures = positions = 0
+    start = time.perf_counter()
+    for number in range(games):
+        board = Board()
+        board.set_fen(fens[number % len(fens)])
+        board.attack_map = AttackMap(board)
+        fen = board.fen()
+        for ply in range(plies):
+            problems = check_position(board)
+            positions += 1
+            for problem in problems:
+                print('game {} ply {}: {}  {}'.format(number, ply, problem, board.fen()))
+            failures += len(problems)
+            moves = board.legal_moves()
+            if not moves:
+                break
+            board.make_move(rng.choice(moves))
+        while board.history:
+            board.unmake_move()
+        if board.fen() != fen or board.hash != board.compute_hash():
+            print('game {}: takebacks did not restore {}'.format(number, fen))
+            failures += 1
+    print('{} games, {} positions, {} problems  {:.2f}s'.format(games, positions, failures,
+                                                               time.perf_counter() - start))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Count legal move tree leaf nodes.')
+    parser.add_argument('depth', type=int, nargs='?', help='plies to search')
+    parser.add_argument('--fen', default=START_FEN, help='position to start from (default: starting position)')
+    parser.add_argument('--divide', action='store_true', help='show the node count after each first move')
+    parser.add_argument('--suite', action='store_true', help='run every reference position to depth')
+    parser.add_argument('--selftest', type=int, metavar='GAMES', help='cross-check the rules core on random games')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for --selftest')
+    args = parser.parse_args(argv)
+
+    if args.selftest is not None:
+        return 0 if not selftest(args.selftest, seed=args.seed) else 1
+    if args.depth is None:
+        parser.error('depth is required unless running --selftest')
+    if args.suite:
+        results = [run(fen, min(args.depth, len(counts)), args.divide) for fen, counts in REFERENCE.items()]
+        ok = all(results)
+    else:
+        ok = run(args.fen, args.depth, args.divide)
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,240 @@
+"""
+Streaming PGN reader. Games are read from a file one line at a time and handed out one at a time, so archives
+far bigger than memory can be replayed through the rules core in board.py. Moves are given in SAN and are
+resolved against the legal moves of the position they are played in, so a game that replays without error is
+a legal game. Runs headless, e.g.
+
+    python pgn.py games.pgn
+"""
+import argparse
+import re
+import sys
+
+from board import *
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+# [Tag "value"], where the value may contain \" and \\
+HEADER = re.compile(r'^\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]\s*$')
+
+# brace comments (which may run past the end of the line), rest-of-line comments, NAGs, variation brackets,
+# move numbers and everything else
+TOKEN = re.compile(r'\{[^}]*\}?|;.*|\$\d+|[()]|\d+\.+|[^\s{};()$]+')
+
+SAN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+CASTLES = {'O-O': 2, '0-0': 2, 'O-O-O': -2, '0-0-0': -2}
+
+
+class IllegalMoveError(ValueError):
+    """
+    A move in a game that can't be read or isn't legal in the position it was played in.
+    """
+
+    def __init__(self, message, san, fen):
+        """
+        :param message: what went wrong
+        :param san: the move as written
+        :param fen: position the move was played in
+        """
+        super().__init__('{}: {} in {}'.format(message, san, fen))
+        self.san = san
+        self.fen = fen
+
+
+class PGNGame:
+    """
+    One game from a PGN file: its tag pairs, its main line moves in SAN and its result. Comments and
+    variations are skipped.
+    """
+
+    def __init__(self, headers, moves, result):
+        """
+        :param headers: dict of tag pairs
+        :param moves: list of SAN strings
+        :param result: termination marker ('1-0', '0-1', '1/2-1/2' or '*'), or None if the game had none
+        """
+        self.headers = headers
+        self.moves = moves
+        self.result = result if result is not None else headers.get('Result', '*')
+
+    def start_board(self):
+        """
+        Board set to the game's starting position, which is the one in its FEN tag if it has one.
+        :return: Board
+        """
+        board = Board()
+        board.set_fen(self.headers.get('FEN', START_FEN))
+        return board
+
+    def replay(self, board=None):
+        """
+        Plays the game's moves one at a time. The same board is yielded after every move, so copy it to keep
+        a position.
+        :param board: Board to play the moves on, the game's starting position by default
+        :return: generator of (san, move, board), raising IllegalMoveError at the first bad move
+        """
+        if board is None:
+            board = self.start_board()
+        for san in self.moves:
+            move = parse_san(board, san)
+            board.make_move(move)
+            yield san, move, board
+
+
+def parse_san(board, san):
+    """
+    Finds the legal move a SAN string describes, e.g. 'Nbd7', 'exd6', 'e8=Q+' or 'O-O-O'. Check, mate and
+    annotation marks are ignored.
+    :param board: Board, with the mover's side to move
+    :param san: str
+    :return: move, or raises IllegalMoveError if no legal move or more than one matches
+    """
+    text = san.rstrip('+#!?')
+    color = board.turn
+    if text in CASTLES:
+        king = board.kings[color]
+        if king is None:
+            raise IllegalMoveError('No king to castle', san, board.fen())
+        target = king + CASTLES[text]
+        matches = [move for move in board.legal_moves_from(king) if move[1] == target]
+    else:
+        match = SAN.match(text)
+        if match is None:
+            raise IllegalMoveError('Unreadable move', san, board.fen())
+        letter, file, rank, target, promotion = match.groups()
+        piece_type = LETTER_PIECES[letter.lower()] if letter else PAWN
+        target = square_from_name(target)
+        promotion = LETTER_PIECES[promotion.lower()] if promotion else None
+        safety = board.king_safety(color)
+        matches = []
+        for sq in squares_of(board.bitboards[(color, piece_type)]):
+            name = square_name(sq)
+            if file and name[0] != file or rank and name[1] != rank:
+                continue
+            matches.extend(move for move in board.legal_moves_from(sq, safety)
+                           if move[1] == target and move[2] == promotion)
+    if not matches:
+        raise IllegalMoveError('Illegal move', san, board.fen())
+    if len(matches) > 1:
+        raise IllegalMoveError('Ambiguous move', san, board.fen())
+    return matches[0]
+
+
+def move_san(board, move):
+    """
+    SAN for a legal move in the board's position, including the check or mate mark.
+    :param board: Board
+    :param move: (from_square, to_square, promotion)
+    :return: str
+    """
+    origin, target, promotion = move
+    color, piece_type = board.squares[origin]
+    if piece_type == KING and abs(target - origin) == 2:
+        san = 'O-O' if target > origin else 'O-O-O'
+    elif piece_type == PAWN:
+        san = ''
+        if target % 8 != origin % 8:
+            san = square_name(origin)[0] + 'x'
+        san += square_name(target)
+        if promotion:
+            san += '=' + PIECE_LETTERS[promotion].upper()
+    else:
+        san = PIECE_LETTERS[piece_type].upper()
+        rivals = [sq for sq in squares_of(board.bitboards[(color, piece_type)])
+                  if sq != origin and any(other[1] == target for other in board.legal_moves_from(sq))]
+        if rivals:
+            if all(sq % 8 != origin % 8 for sq in rivals):
+                san += square_name(origin)[0]
+            elif all(sq // 8 != origin // 8 for sq in rivals):
+                san += square_name(origin)[1]
+            else:
+                san += square_name(origin)
+        if board.squares[target] is not None:
+            san += 'x'
+        san += square_name(target)
+    board.make_move(move)
+    if board.in_check():
+        san += '#' if not board.has_legal_move() else '+'
+    board.unmake_move()
+    return san
+
+
+def read_games(stream):
+    """
+    Reads games from a PGN text stream. Only the game being read is held in memory, so a file of any size can
+    be read in constant memory.
+    :param stream: file or other iterable of lines
+    :return: generator of PGNGame
+    """
+    headers = {}
+    moves = []
+    in_moves = False
+    in_comment = False
+    depth = 0  # variation nesting
+    for line in stream:
+        if in_comment:
+            end = line.find('}')
+            if end < 0:
+                continue
+            line = line[end + 1:]
+            in_comment = False
+        stripped = line.strip()
+        if not stripped or stripped.startswith('%'):
+            continue
+        header = HEADER.match(stripped) if stripped.startswith('[') and not depth else None
+        if header:
+            if in_moves:
+                yield PGNGame(headers, moves, None)
+                headers, moves, in_moves, depth = {}, [], False, 0
+            headers[header.group(1)] = header.group(2).replace('\\"', '"').replace('\\\\', '\\')
+            continue
+        for token in TOKEN.findall(line):
+            if token[0] == '{':
+                in_comment = not token.endswith('}')
+            elif token == '(':
+                depth += 1
+            elif token == ')':
+                depth = max(depth - 1, 0)
+            elif depth or token[0] in ';$' or token[0].isdigit() and token.endswith('.'):
+                continue
+            elif token in RESULTS:
+                yield PGNGame(headers, moves, token)
+                headers, moves, in_moves, depth = {}, [], False, 0
+            elif token != 'e.p.':
+                moves.append(token)
+                in_moves = True
+    if in_moves or headers:
+        yield PGNGame(headers, moves, None)
+
+
+def open_games(path):
+    """
+    Reads games from a PGN file.
+    :param path: str
+    :return: generator of PGNGame
+    """
+    with open(path, encoding='utf-8', errors='replace') as stream:
+        yield from read_games(stream)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay the games in a PGN file through the rules engine.')
+    parser.add_argument('path', help='PGN file')
+    args = parser.parse_args(argv)
+
+    games = illegal = 0
+    for number, game in enumerate(open_games(args.path), 1):
+        games += 1
+        plies = 0
+        try:
+            for plies, (san, move, board) in enumerate(game.replay(), 1):
+                pass
+        except ValueError as error:
+            illegal += 1
+            print('game {}: after {} plies: {}'.format(number, plies, error))
+    print('{} games, {} with illegal moves'.format(games, illegal))
+    return 0 if not illegal else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -12,8 +12,16 @@ TITLE = "Chess"
 WIDTH = 900
 HEIGHT = 700
 FPS = 60
+IDLE_TIMEOUT = 500  # most milliseconds the game loop sleeps waiting for an event while nothing is moving
 FONT_NAME = pg.font.match_font('arial')
 FONT_SIZE = 20
+MOVE_CACHE_SIZE = 16384  # pieces whose legal moves are remembered, by position and square
+ENGINE_DEPTH = 20  # most plies the computer opponent searches
+ENGINE_TIME = 1.5  # seconds the computer opponent thinks for
+TT_MEGABYTES = 32  # memory the computer opponent's transposition table may use
+BOOK_PATH = './book.bin'  # Polyglot opening book, used if the file exists
+TABLEBASE_PATH = './tablebases'  # endgame tablebases made by tablebase.py, used if the directory exists
+ENGINE_MOVE = pg.USEREVENT + 1  # event posted when the computer opponent has picked a move
 
 # define colors
 WHITE = (255, 255, 255)
@@ -0,0 +1,495 @@
+"""
+Endgame tablebases: the exact result and distance to mate of every position with a small set of pieces, worked
+out by retrograde analysis. Starting from the checkmates, results are passed back one ply at a time to the
+positions that lead to them, until every position that can be won or lost has been reached; whatever is left
+is a draw.
+
+A table covers one material set, named like KQK or KPK with the stronger side first, and is stored as one byte
+per position in a file named after it. The byte is found by arithmetic on the piece squares and the side to
+move, so a probe is a single read from the memory-mapped file. Positions with the colors the other way round
+are probed mirrored. Castling rights and En Passant aren't covered. Runs headless, e.g.
+
+    python tablebase.py generate KQK KRK KPK
+    python tablebase.py probe --fen "8/8/8/4k3/8/8/8/4K2Q w - - 0 1"
+"""
+import argparse
+import mmap
+import multiprocessing
+import os
+import sys
+from array import array
+
+from board import *
+
+LETTERS = 'KQRBNP'  # order of pieces within a side
+LETTER_TYPES = {'K': KING, 'Q': QUEEN, 'R': ROOK, 'B': BISHOP, 'N': KNIGHT, 'P': PAWN}
+STRENGTH = {'K': 0, 'Q': 9, 'R': 5, 'B': 3, 'N': 3, 'P': 1}
+DRAWN = ('KK', 'KBK', 'KNK')  # material that can't mate, so needs no table
+
+# stored values: DRAW, ILLEGAL, or plies to mate + 1, the side to move winning when the plies are odd
+DRAW = 0
+ILLEGAL = 255
+
+# what generation finds out about a single position before results are passed back
+NORMAL, INVALID, MATED, STALEMATE = 0, 1, 2, 3
+
+
+def side_name(letters):
+    """
+    Puts one side's pieces in the standard order, king first.
+    :param letters: str, e.g. 'PK'
+    :return: str, e.g. 'KP'
+    """
+    return 'K' + ''.join(sorted(letters.replace('K', ''), key=LETTERS.index))
+
+
+def material_name(white, black):
+    """
+    Name of the table for a material set, with the stronger side first.
+    :param white: White's piece letters
+    :param black: Black's piece letters
+    :return: (name, flipped), flipped being True when Black is the side listed first
+    """
+    white, black = side_name(white), side_name(black)
+    white_strength = sum(STRENGTH[letter] for letter in white)
+    black_strength = sum(STRENGTH[letter] for letter in black)
+    if (black_strength, black) > (white_strength, white):
+        return black + white, True
+    return white + black, False
+
+
+def split_name(name):
+    """
+    Splits a table name into the two sides' pieces.
+    :param name: str, e.g. 'KQK'
+    :return: (strong side letters, weak side letters)
+    """
+    middle = name.index('K', 1)
+    return name[:middle], name[middle:]
+
+
+def board_material(board):
+    """
+    Piece letters for each side of a position.
+    :param board: Board
+    :return: (white letters, black letters)
+    """
+    sides = []
+    for color in (WHITE, BLACK):
+        sides.append(''.join(letter * count(board.bitboards[(color, LETTER_TYPES[letter])]) for letter in LETTERS))
+    return sides[0], sides[1]
+
+
+def sub_materials(name):
+    """
+    Material sets a capture or promotion can lead to from a table, other than drawn ones.
+    :param name: str
+    :return: set of table names
+    """
+    strong, weak = split_name(name)
+    found = set()
+    for side, other, first in ((strong, weak, True), (weak, strong, False)):
+        for n, letter in enumerate(side):
+            if letter == 'K':
+                continue
+            changed = [side[:n] + side[n + 1:]]  # captured
+            if letter == 'P':
+                changed += [side[:n] + promoted + side[n + 1:] for promoted in 'QRBN']
+            for new in changed:
+                pair = (new, other) if first else (other, new)
+                sub, flipped = material_name(*pair)
+                if sub not in DRAWN and sub != name:
+                    found.add(sub)
+    return found
+
+
+class Table:
+    """
+    One material set's results, indexed by piece squares and side to move.
+    """
+
+    def __init__(self, name, data):
+        """
+        :param name: str, e.g. 'KQK'
+        :param data: bytes-like of 2 * 64 ** pieces values
+        """
+        self.name = name
+        strong, weak = split_name(name)
+        self.slots = [(WHITE, LETTER_TYPES[letter]) for letter in strong] + \
+                     [(BLACK, LETTER_TYPES[letter]) for letter in weak]
+        self.groups = []  # (color, piece_type, first slot, slot count) for each kind of piece
+        for n, piece in enumerate(self.slots):
+            if self.groups and self.groups[-1][:2] == piece:
+                color, piece_type, first, size = self.groups[-1]
+                self.groups[-1] = (color, piece_type, first, size + 1)
+            else:
+                self.groups.append(piece + (n, 1))
+        self.size = 2 * 64 ** len(self.slots)
+        self.data = data
+
+    def index(self, board, flipped=False):
+        """
+        Where a position's value is stored.
+        :param board: Board with this table's material
+        :param flipped: True if the board's colors are the other way round from the table's
+        :return: int
+        """
+        index = 0
+        for color, piece_type, first, size in self.groups:
+            if flipped:
+                squares = sorted(sq ^ 56 for sq in squares_of(board.bitboards[(opponent(color), piece_type)]))
+            else:
+                squares = squares_of(board.bitboards[(color, piece_type)])
+            for sq in squares:
+                index = index * 64 + sq
+        return index * 2 + ((board.turn == BLACK) != flipped)
+
+    def squares_index(self, squares, turn):
+        """
+        Index for piece squares given in slot order, with pieces of the same kind put in square order.
+        :param squares: list of int
+        :param turn: 'White' / 'Black'
+        :return: int
+        """
+        index = 0
+        for color, piece_type, first, size in self.groups:
+            group = squares[first:first + size] if size == 1 else sorted(squares[first:first + size])
+            for sq in group:
+                index = index * 64 + sq
+        return index * 2 + (turn == BLACK)
+
+    def decode(self, index):
+        """
+        Reverses squares_index.
+        :param index: int
+        :return: (list of squares in slot order, turn)
+        """
+        turn = BLACK if index & 1 else WHITE
+        index >>= 1
+        squares = []
+        for _ in self.slots:
+            squares.append(index % 64)
+            index //= 64
+        squares.reverse()
+        return squares, turn
+
+
+def value_result(value):
+    """
+    Reads a stored value.
+    :param value: int
+    :return: ('Win' / 'Loss' / 'Draw' for the side to move, plies to mate or None), or None if illegal
+    """
+    if value == ILLEGAL:
+        return None
+    if value == DRAW:
+        return 'Draw', None
+    plies = value - 1
+    return ('Win' if plies % 2 else 'Loss'), plies
+
+
+class Tablebases:
+    """
+    The tables in a directory, each memory-mapped the first time it is needed.
+    """
+
+    def __init__(self, directory):
+        """
+        :param directory: str
+        """
+        self.directory = directory
+        self.tables = {}
+        self.names = set()
+        if os.path.isdir(directory):
+            self.names = {file[:-3] for file in os.listdir(directory) if file.endswith('.tb')}
+        self.max_pieces = max((len(name) for name in self.names), default=0)
+
+    def table(self, name):
+        """
+        Opens a table.
+        :param name: str
+        :return: Table, or None if there is no file for it
+        """
+        if name not in self.tables:
+            table = None
+            if name in self.names:
+                with open(os.path.join(self.directory, name + '.tb'), 'rb') as file:
+                    table = Table(name, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+            self.tables[name] = table
+        return self.tables[name]
+
+    def probe_value(self, board):
+        """
+        Stored value for a position.
+        :param board: Board
+        :return: int, or None if no table covers the position
+        """
+        if board.castling or board.passant_capturable():
+            return None
+        name, flipped = material_name(*board_material(board))
+        if name in DRAWN:
+            return DRAW
+        table = self.table(name)
+        if table is None:
+            return None
+        return table.data[table.index(board, flipped)]
+
+    def probe(self, board):
+        """
+        Result of a position with best play.
+        :param board: Board
+        :return: (result, plies) as from value_result, or None if no table covers the position
+        """
+        value = self.probe_value(board)
+        return value_result(value) if value is not None else None
+
+    def best_move(self, board):
+        """
+        Move that wins fastest, draws, or loses slowest, going by the tables.
+        :param board: Board
+        :return: move, or None if the position or one of its moves isn't covered
+        """
+        best, best_rank = None, None
+        for move in board.legal_moves():
+            board.make_move(move)
+            value = self.probe_value(board)
+            board.unmake_move()
+            if value is None or value == ILLEGAL:
+                return None
+            if value == DRAW:
+                rank = 0
+            elif (value - 1) % 2 == 0:  # opponent loses
+                rank = 1000 - value
+            else:
+                rank = value - 1000
+            if best_rank is None or rank > best_rank:
+                best, best_rank = move, rank
+        return best
+
+
+_tablebases = None  # sub-tables, opened once in each worker process
+
+
+def _open_tablebases(directory):
+    """
+    Pool initializer: opens the sub-tables captures and promotions lead to.
+    :param directory: str
+    :return:
+    """
+    global _tablebases
+    _tablebases = Tablebases(directory)
+
+
+def _explore(name, start, end):
+    """
+    Worker entry point: sets up each position in an index range and lists where its moves lead.
+    :param name: table being generated
+    :param start: first index
+    :param end: index after the last
+    :return: (kinds, child counts, children, outside counts, outside values) for the range, where children
+             are indexes in this table and outside values are results of captures and promotions
+    """
+    table = Table(name, None)
+    kinds = bytearray(end - start)
+    child_counts = array('B', bytes(end - start))
+    children = array('I')
+    outside_counts = array('B', bytes(end - start))
+    outside_values = bytearray()
+    for offset, index in enumerate(range(start, end)):
+        squares, turn = table.decode(index)
+        kings = [sq for sq, piece in zip(squares, table.slots) if piece[1] == KING]
+        if len(set(squares)) < len(squares) or KING_ATTACKS[kings[0]] >> kings[1] & 1 or \
+                any(piece[1] == PAWN and sq // 8 in (0, 7) for sq, piece in zip(squares, table.slots)):
+            kinds[offset] = INVALID
+            continue
+        board = Board()
+        for sq, piece in zip(squares, table.slots):
+            board.put(sq, piece)
+        board.turn = turn
+        if board.in_check(opponent(turn)):
+            kinds[offset] = INVALID
+            continue
+        moves = board.legal_moves()
+        if not moves:
+            kinds[offset] = MATED if board.in_check() else STALEMATE
+            continue
+        inside = outside = 0
+        for move in moves:
+            origin, target, promotion = move
+            if board.squares[target] is not None or promotion:
+                board.make_move(move)
+                value = _tablebases.probe_value(board)
+                board.unmake_move()
+                if value is None:
+                    raise ValueError('Missing table for ' + material_name(*board_material(board))[0])
+                outside_values.append(value)
+                outside += 1
+            else:
+                moved = squares.copy()
+                moved[squares.index(origin)] = target
+                children.append(table.squares_index(moved, opponent(turn)))
+                inside += 1
+        child_counts[offset] = inside
+        outside_counts[offset] = outside
+    return kinds, child_counts, children, outside_counts, outside_values
+
+
+def solve(name, directory, workers=None):
+    """
+    Generates one table: positions are explored on every core, then results are passed back from the mates
+    in order of distance. A position is won as soon as one move reaches a lost position, and lost once every
+    move has been found to reach a won one, the last found being the longest.
+    :param name: str
+    :param directory: where sub-tables are read from
+    :param workers: number of processes, one per core by default
+    :return: bytearray of values
+    """
+    size = Table(name, None).size
+    workers = workers or multiprocessing.cpu_count()
+    step = max(1, size // (workers * 16))
+    ranges = [(name, start, min(start + step, size)) for start in range(0, size, step)]
+    kinds = bytearray()
+    child_counts = array('B')
+    children = array('I')
+    outside_counts = array('B')
+    outside_values = bytearray()
+    with multiprocessing.Pool(workers, _open_tablebases, (directory,)) as pool:
+        for part in pool.starmap(_explore, ranges):
+            kinds += part[0]
+            child_counts.extend(part[1])
+            children.extend(part[2])
+            outside_counts.extend(part[3])
+            outside_values += part[4]
+
+    # positions leading to each position, the reverse of children
+    parent_counts = array('I', bytes(4 * (size + 1)))
+    for child in children:
+        parent_counts[child + 1] += 1
+    for index in range(size):
+        parent_counts[index + 1] += parent_counts[index]
+    parent_starts = parent_counts
+    parents = array('I', bytes(4 * len(children)))
+    filled = array('I', parent_starts[:size])
+    position = 0
+    for index in range(size):
+        for child in children[position:position + child_counts[index]]:
+            parents[filled[child]] = index
+            filled[child] += 1
+        position += child_counts[index]
+
+    values = bytearray(size)
+    remaining = array('i', (child_counts[index] + outside_counts[index] for index in range(size)))
+    resolved = {}  # distance -> positions whose result became known at that distance
+    outside_wins = {}  # distance -> positions with a capture or promotion into a loss at that distance
+    outside_losses = {}  # distance -> positions with a capture or promotion into a win at that distance
+    position = 0
+    for index in range(size):
+        if kinds[index] == INVALID:
+            values[index] = ILLEGAL
+        elif kinds[index] == MATED:
+            values[index] = 1
+            resolved.setdefault(0, []).append(index)
+        for value in outside_values[position:position + outside_counts[index]]:
+            if value not in (DRAW, ILLEGAL):
+                plies = value - 1
+                queue = outside_losses if plies % 2 else outside_wins
+                queue.setdefault(plies, []).append(index)
+        position += outside_counts[index]
+
+    distance = 0
+    while resolved or outside_wins or outside_losses:
+        found = resolved.setdefault(distance + 1, [])
+        for index in outside_wins.pop(distance, ()):
+            if not values[index]:
+                values[index] = distance + 2
+                found.append(index)
+        for index in outside_losses.pop(distance, ()):
+            if not values[index]:
+                remaining[index] -= 1
+                if not remaining[index]:
+                    values[index] = distance + 2
+                    found.append(index)
+        for index in resolved.pop(distance, ()):
+            lost = distance % 2 == 0
+            for parent in parents[parent_starts[index]:parent_starts[index + 1]]:
+                if values[parent]:
+                    continue
+                if not lost:
+                    remaining[parent] -= 1
+                    if remaining[parent]:
+                        continue
+                values[parent] = distance + 2
+                found.append(parent)
+        if not found:
+            del resolved[distance + 1]
+        distance += 1
+        if distance + 2 >= ILLEGAL:
+            raise ValueError('Distance to mate too long to store in ' + name)
+    return values
+
+
+def generate(name, directory, workers=None):
+    """
+    Writes a table to the directory, generating the tables its captures and promotions lead to first.
+    :param name: material set, e.g. 'KQK'
+    :param directory: str
+    :param workers: number of processes, one per core by default
+    :return:
+    """
+    name = material_name(*split_name(name))[0]
+    path = os.path.join(directory, name + '.tb')
+    if os.path.isfile(path) or name in DRAWN:
+        return
+    for sub in sorted(sub_materials(name)):
+        generate(sub, directory, workers)
+    os.makedirs(directory, exist_ok=True)
+    print('generating', name)
+    values = solve(name, directory, workers)
+    with open(path + '.part', 'wb') as file:
+        file.write(values)
+    os.replace(path + '.part', path)
+
+
+def describe(board, result):
+    """
+    Words for a probe result.
+    :param board: Board probed
+    :param result: (result, plies) from Tablebases.probe
+    :return: str
+    """
+    outcome, plies = result
+    if outcome == 'Draw':
+        return 'Draw'
+    winner = board.turn if outcome == 'Win' else opponent(board.turn)
+    return '{} mates in {}'.format(winner, (plies + 1) // 2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate or probe endgame tablebases.')
+    parser.add_argument('--dir', default='tablebases', help='directory the tables are kept in')
+    commands = parser.add_subparsers(dest='command', required=True)
+    generate_parser = commands.add_parser('generate', help='generate tables for material sets')
+    generate_parser.add_argument('names', nargs='+', help='material sets, e.g. KQK KRK KPK')
+    generate_parser.add_argument('--workers', type=int, default=None, help='processes to use (default: one per core)')
+    probe_parser = commands.add_parser('probe', help='look a position up')
+    probe_parser.add_argument('--fen', required=True, help='position to look up')
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        for name in args.names:
+            generate(name.upper(), args.dir, args.workers)
+        return 0
+    board = Board()
+    board.set_fen(args.fen)
+    tablebases = Tablebases(args.dir)
+    result = tablebases.probe(board)
+    if result is None:
+        print('not in the tablebases')
+        return 1
+    move = tablebases.best_move(board)
+    print(describe(board, result) + ('' if move is None else ', best move ' + move_name(move)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Transposition table for the engine: search results keyed by Zobrist hash, so a position reached again by a
+different move order (or searched again by the next iteration) doesn't have to be searched from scratch.
+
+The table is two flat arrays of 64-bit ints sized to a memory budget, one for keys and one for entries packed
+into a single int each. Entries live in buckets of two: the first slot keeps whichever result was searched
+deepest and the second always takes the latest result, so deep results survive while recent ones still get
+stored. Each entry also records the search it came from, so results left over from earlier moves give way to
+the current search however deep they were.
+"""
+from array import array
+
+from board import pack_move, unpack_move
+
+DEFAULT_MEGABYTES = 16
+ENTRY_BYTES = 16  # 8 for the key, 8 for the packed entry
+
+# bound types
+EXACT = 0
+LOWER = 1  # score is at least this (the search failed high)
+UPPER = 2  # score is at most this (the search failed low)
+
+# packed entry: bits 0-15 move, 16-47 score, 48-55 depth, 56-57 bound, 58-62 generation,
+# 63 set when the slot is in use
+SCORE_OFFSET = 1 << 31
+GENERATIONS = 32
+USED = 1 << 63
+
+
+class TranspositionTable:
+    """
+    Fixed-size table of search results.
+    """
+
+    def __init__(self, megabytes=DEFAULT_MEGABYTES):
+        """
+        Allocates the largest power of two number of buckets that fits in the budget.
+        :param megabytes: memory budget
+        """
+        buckets = max(1, int(megabytes * 2 ** 20) // (2 * ENTRY_BYTES))
+        buckets = 1 << buckets.bit_length() - 1
+        self.mask = buckets - 1
+        self.keys = array('Q', bytes(16 * buckets))
+        self.entries = array('Q', bytes(16 * buckets))
+        self.generation = 0
+
+    def clear(self):
+        """
+        Empties the table.
+        :return:
+        """
+        size = len(self.keys)
+        self.keys = array('Q', bytes(8 * size))
+        self.entries = array('Q', bytes(8 * size))
+        self.generation = 0
+
+    def new_search(self):
+        """
+        Starts a new generation: everything stored so far becomes stale and can be replaced regardless of depth.
+        :return:
+        """
+        self.generation = (self.generation + 1) % GENERATIONS
+
+    def probe(self, key):
+        """
+        Looks up a position.
+        :param key: Zobrist hash
+        :return: (depth, bound, score, move), or None if the position isn't stored
+        """
+        index = (key & self.mask) << 1
+        keys = self.keys
+        if keys[index] == key:
+            entry = self.entries[index]
+        elif keys[index + 1] == key:
+            entry = self.entries[index + 1]
+        else:
+            return None
+        if not entry & USED:
+            return None
+        return entry >> 48 & 0xFF, entry >> 56 & 3, (entry >> 16 & 0xFFFFFFFF) - SCORE_OFFSET, \
+            unpack_move(entry & 0xFFFF)
+
+    def store(self, key, depth, bound, score, move):
+        """
+        Stores a search result. It goes in the depth-preferred slot if that slot is empty, holds the same
+        position, holds a result from an earlier search or holds a shallower one, and in the always-replace slot
+        otherwise.
+        :param key: Zobrist hash
+        :param depth: plies searched, 0-255
+        :param bound: EXACT, LOWER or UPPER
+        :param score: int
+        :param move: best move found, or None
+        :return:
+        """
+        index = (key & self.mask) << 1
+        entries = self.entries
+        current = entries[index]
+        generation = self.generation
+        if current & USED and self.keys[index] != key and current >> 58 & 0x1F == generation \
+                and current >> 48 & 0xFF > depth:
+            index += 1
+        self.keys[index] = key
+        entries[index] = USED | generation << 58 | bound << 56 | depth << 48 | score + SCORE_OFFSET << 16 | \
+            pack_move(move)
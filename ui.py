@@ -67,5 +67,20 @@ class CapturedBox:
             x += TILESIZE / 2
         self.next_box_position = (x, y)
 
+    def set_previous_box_position(self):
+        """
+        Steps the next box position back one place, used when a captured piece is restored to the board.
+        :return:
+        """
+        x, y = self.next_box_position
+        if self.column == 0:
+            self.column = 4
+            y -= TILESIZE / 2
+            x = self.x + 4 * TILESIZE / 2
+        else:
+            self.column -= 1
+            x -= TILESIZE / 2
+        self.next_box_position = (x, y)
+
     def draw(self):
         pg.draw.rect(self.main.screen, BLACK, self.box, 2)
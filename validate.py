@@ -0,0 +1,158 @@
+"""
+Bulk game validation. Games are streamed out of a PGN file in batches and replayed on a pool of worker
+processes, one per core by default, and the reports come back in file order. Runs headless, e.g.
+
+    python validate.py games.pgn
+    python validate.py games.pgn --workers 4 --verbose
+"""
+import argparse
+import multiprocessing
+import sys
+import time
+from collections import Counter, deque
+
+from board import FIFTY_MOVES, INSUFFICIENT, REPETITION
+from pgn import open_games
+
+
+class GameReport:
+    """
+    What replaying one game found: how far it got, the first illegal move if there was one, and whether the
+    final position is checkmate, stalemate or a draw by rule.
+    """
+
+    def __init__(self, number, game):
+        """
+        :param number: position of the game in its file, counting from 1
+        :param game: PGNGame
+        """
+        self.number = number
+        self.white = game.headers.get('White', '?')
+        self.black = game.headers.get('Black', '?')
+        self.result = game.result
+        self.plies = 0
+        self.error = None  # message for the first move that couldn't be played
+        self.outcome = None  # 'Checkmate' / 'Stalemate' / a draw by rule if the final position is one
+        self.fen = None  # final position
+
+    def __str__(self):
+        text = 'game {} ({} - {}) {} plies, {}'.format(self.number, self.white, self.black, self.plies, self.result)
+        if self.outcome:
+            text += ', ' + self.outcome
+        if self.error:
+            text += ', ' + self.error
+        return text
+
+
+def validate_game(number, game):
+    """
+    Replays a game through the rules core and reports on it. The checks are the ones GameData makes in the
+    UI: every move has to be one of the legal moves of its position, and a side with no legal moves at the
+    end has been mated if in check and stalemated otherwise. A side that can still move may have reached a
+    draw by the fifty-move rule, threefold repetition or insufficient material.
+    :param number: position of the game in its file
+    :param game: PGNGame
+    :return: GameReport
+    """
+    report = GameReport(number, game)
+    try:
+        board = game.start_board()
+        for report.plies, (san, move, board) in enumerate(game.replay(board), 1):
+            pass
+    except ValueError as error:
+        report.error = str(error)
+        return report
+    if not board.has_legal_move():
+        report.outcome = 'Checkmate' if board.in_check() else 'Stalemate'
+    else:
+        report.outcome = board.draw_reason()
+    report.fen = board.fen()
+    return report
+
+
+def validate_batch(batch):
+    """
+    Worker entry point: validates a batch of games.
+    :param batch: list of (number, PGNGame)
+    :return: list of GameReport
+    """
+    return [validate_game(number, game) for number, game in batch]
+
+
+def batches(games, size):
+    """
+    Groups numbered games into lists of size games.
+    :param games: iterable of PGNGame
+    :param size: int
+    :return: generator of list of (number, PGNGame)
+    """
+    batch = []
+    for number, game in enumerate(games, 1):
+        batch.append((number, game))
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def validate_games(games, workers=None, batch_size=64):
+    """
+    Validates games across a pool of processes. Only a few batches per worker are in flight at once, so the
+    input is read no faster than it is validated, and reports are yielded in the same order as the games.
+    :param games: iterable of PGNGame
+    :param workers: number of processes, one per core by default; 1 validates in this process
+    :param batch_size: games sent to a worker at a time
+    :return: generator of GameReport
+    """
+    workers = workers or multiprocessing.cpu_count()
+    if workers == 1:
+        for batch in batches(games, batch_size):
+            yield from validate_batch(batch)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        pending = deque()
+        for batch in batches(games, batch_size):
+            pending.append(pool.apply_async(validate_batch, (batch,)))
+            if len(pending) >= workers * 4:
+                yield from pending.popleft().get()
+        while pending:
+            yield from pending.popleft().get()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Validate the games in a PGN file on every core.')
+    parser.add_argument('path', help='PGN file')
+    parser.add_argument('--workers', type=int, default=None, help='processes to use (default: one per core)')
+    parser.add_argument('--batch', type=int, default=64, help='games per batch sent to a worker')
+    parser.add_argument('--verbose', action='store_true', help='print a line for every game, not just bad ones')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    games = illegal = plies = 0
+    outcomes = Counter()
+    results = Counter()
+    for report in validate_games(open_games(args.path), args.workers, args.batch):
+        games += 1
+        plies += report.plies
+        results[report.result] += 1
+        if report.outcome:
+            outcomes[report.outcome] += 1
+        if report.error:
+            illegal += 1
+        if report.error or args.verbose:
+            print(report)
+    elapsed = time.perf_counter() - start
+
+    rate = games / elapsed if elapsed else 0.0
+    print('{} games, {} plies, {} with illegal moves  {:.2f}s  {:,.0f} games/s'.format(
+        games, plies, illegal, elapsed, rate))
+    print('results:', ', '.join('{} {}'.format(result, n) for result, n in sorted(results.items())))
+    print('checkmates: {}  stalemates: {}  fifty moves: {}  repetitions: {}  insufficient material: {}'.format(
+        outcomes['Checkmate'], outcomes['Stalemate'], outcomes[FIFTY_MOVES], outcomes[REPETITION],
+        outcomes[INSUFFICIENT]))
+    return 0 if not illegal else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())